@@ -1,45 +1,89 @@
+import re
 import uuid
+import codecs
+import asyncio
+import threading
 import boto3
 
 # 固定使用一组 Agent ID 与 Alias ID
 AGENT_ID = "KE5K7EJATO"
 AGENT_ALIAS_ID = "5QE209YEBI"
-
-# 每个会话独立 UUID
-session_id = str(uuid.uuid1())
+USE_FAKE_AGENT = False       # True: 不连接 AWS，使用 agent/fakes.py 的本地桩（本地确认・测试用）
+AGENT_MAX_CONCURRENCY = 8    # 同时进行的 Agent 流式调用上限（每个调用占一个后台线程）
+AGENT_QUEUE_TIMEOUT = 30     # 达到上限时等待空位的最长秒数
 
 # 创建客户端（确保 AWS 权限没问题）
-client = boto3.client("bedrock-agent-runtime", region_name="us-east-1")
+if USE_FAKE_AGENT:
+    from agent.fakes import FakeAgentClient
+    client = FakeAgentClient(delay=0.05)
+else:
+    client = boto3.client("bedrock-agent-runtime", region_name="us-east-1")
+
+AGENT_BUSY_MESSAGE = "ただいま混み合っています。しばらくしてから再度お試しください。"
+# 事件循环内共享的并发名额（Python 3.10+ 的 asyncio.Semaphore 首次使用时才绑定事件循环）
+_stream_slots = asyncio.Semaphore(AGENT_MAX_CONCURRENCY)
+
+# chunk 文本中的调用标记：一次正则扫描，取最后出现的标记
+_INVOCATION_MARKER = re.compile(r'"type":"(ActionGroupInvocation|KnowledgeBaseQuery)"')
+_MARKER_CATEGORY = {"ActionGroupInvocation": "a", "KnowledgeBaseQuery": "c"}
+# enableTrace=True 时 orchestrationTrace 里直接给出调用类型
+_INVOCATION_CATEGORY = {"ACTION_GROUP": "a", "KNOWLEDGE_BASE": "c"}
+
+
+def _trace_category(event):
+    trace = event.get("trace", {}).get("trace", {})
+    invocation = trace.get("orchestrationTrace", {}).get("invocationInput", {})
+    return _INVOCATION_CATEGORY.get(invocation.get("invocationType"))
+
 
-def run_bedrock_agent(prompt: str) -> str:
+def iter_agent_events(prompt: str, agent_client=None, agent_session_id=None):
+    """
+    调用 invoke_agent 并逐个产出 ("chunk", 文本) 事件，最后产出 ("category", 分类)。
+    分类：a = Action Group（最新信息取得），c = Knowledge Base（文書検索），b = 一般知識（默认）。
+    agent_client 可替换为本地假客户端（需实现 invoke_agent）。
+    agent_session_id 为 None 时使用一次性的新会话（不保留上下文）。
+    """
+    response = (agent_client or client).invoke_agent(
+        inputText=prompt,
+        agentId=AGENT_ID,
+        agentAliasId=AGENT_ALIAS_ID,
+        sessionId=agent_session_id or str(uuid.uuid4()),
+        enableTrace=True,
+    )
+
+    classification = "b"  # デフォルトは一般知識
+    # chunk 边界可能切断多字节 UTF-8 字符，用增量解码器拼接
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    for event in response["completion"]:
+        if "chunk" in event:
+            chunk_text = decoder.decode(event["chunk"]["bytes"])
+            markers = _INVOCATION_MARKER.findall(chunk_text)
+            if markers:
+                classification = _MARKER_CATEGORY[markers[-1]]
+            if chunk_text:
+                yield "chunk", chunk_text
+        elif "trace" in event:
+            classification = _trace_category(event) or classification
+
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield "chunk", tail
+    yield "category", classification
+
+
+def run_bedrock_agent(prompt: str, agent_client=None, agent_session_id=None) -> dict:
     try:
-        response = client.invoke_agent(
-            inputText=prompt,
-            agentId=AGENT_ID,
-            agentAliasId=AGENT_ALIAS_ID,
-            sessionId=session_id,
-            enableTrace=True,
-        )
-
-        # 逐步取得 response 内容
-        event_stream = response["completion"]
-        full_text = ""
-        classification = "b"  # デフォルトは一般知識
-
-        for event in event_stream:
-            if "chunk" in event:
-                chunk_text = event["chunk"]["bytes"].decode("utf-8")
-                full_text += chunk_text
-
-                # 检查是否提到 action/function 或 knowledge base
-                if '"type":"ActionGroupInvocation"' in chunk_text:
-                    classification = "a"
-                elif '"type":"KnowledgeBaseQuery"' in chunk_text:
-                    classification = "c"
-
-        #return full_text
+        parts = []
+        classification = "b"
+        for kind, value in iter_agent_events(prompt, agent_client, agent_session_id):
+            if kind == "chunk":
+                parts.append(value)
+            else:
+                classification = value
+
         return {
-            "text": full_text,
+            "text": "".join(parts),
             "category": classification
         }
     except Exception as e:
@@ -47,4 +91,63 @@ def run_bedrock_agent(prompt: str) -> str:
         return {
             "text": f"エラーが発生しました: {str(e)}",
             "category": "エラー"
-        }
\ No newline at end of file
+        }
+
+
+async def stream_bedrock_agent(prompt: str, agent_client=None, agent_session_id=None):
+    """
+    iter_agent_events 的异步版本：事件流在后台线程里读取，事件循环不被阻塞；
+    每收到一个事件就 yield ("chunk"|"category"|"error", 值)。
+    同时进行的调用数受 AGENT_MAX_CONCURRENCY 限制，超过 AGENT_QUEUE_TIMEOUT 秒仍无空位时返回 error。
+    调用方中途停止读取（客户端断开）时，后台线程在下一个事件处停止读取事件流。
+    """
+    try:
+        await asyncio.wait_for(_stream_slots.acquire(), AGENT_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        yield "error", AGENT_BUSY_MESSAGE
+        return
+
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+    cancelled = threading.Event()
+
+    def worker():
+        try:
+            for event in iter_agent_events(prompt, agent_client, agent_session_id):
+                if cancelled.is_set():
+                    break
+                loop.call_soon_threadsafe(events.put_nowait, event)
+        except Exception as e:
+            loop.call_soon_threadsafe(events.put_nowait, ("error", f"エラーが発生しました: {str(e)}"))
+        finally:
+            # 名额在线程真正结束时才归还，线程数不会超过上限
+            loop.call_soon_threadsafe(_stream_slots.release)
+            loop.call_soon_threadsafe(events.put_nowait, None)
+
+    try:
+        threading.Thread(target=worker, name="bedrock-agent-stream", daemon=True).start()
+    except Exception:
+        _stream_slots.release()
+        raise
+
+    try:
+        while True:
+            event = await events.get()
+            if event is None:
+                break
+            yield event
+    finally:
+        cancelled.set()
+
+
+async def run_bedrock_agent_async(prompt: str, agent_client=None, agent_session_id=None) -> dict:
+    parts = []
+    classification = "b"
+    async for kind, value in stream_bedrock_agent(prompt, agent_client, agent_session_id):
+        if kind == "chunk":
+            parts.append(value)
+        elif kind == "category":
+            classification = value
+        else:
+            return {"text": value, "category": "エラー"}
+    return {"text": "".join(parts), "category": classification}
@@ -0,0 +1,68 @@
+import uuid
+from contextlib import asynccontextmanager
+from commons.cache import TTLCache
+
+
+class SessionBusyError(Exception):
+    """同一会话的并发轮次超过上限"""
+
+
+class _AgentSession:
+    def __init__(self):
+        self.agent_session_id = str(uuid.uuid4())
+        self.inflight = 0
+
+
+class AgentSessionPool:
+    """
+    客户端会话 ID → Bedrock Agent sessionId 的映射。
+    - maxsize：最多保留的会话数，超出时淘汰最久未使用的（LRU）
+    - idle_ttl：空闲超过该秒数的会话失效，下次访问会开新的 Agent 会话
+    - max_inflight：同一会话同时进行中的轮次上限，超出抛 SessionBusyError
+    进行中的会话放在 _active 里，不受 LRU / TTL 淘汰影响（否则同一 ID 的并发请求会拿到新会话、绕过 max_inflight），
+    最后一个轮次结束后再放回 TTLCache。
+    只在事件循环线程中使用（计数无需加锁）。
+    """
+
+    def __init__(self, maxsize=1000, idle_ttl=1800, max_inflight=1):
+        self.max_inflight = max_inflight
+        self._sessions = TTLCache(maxsize=maxsize, ttl=idle_ttl)
+        self._active = {}  # client_session_id -> _AgentSession（inflight > 0）
+
+    @staticmethod
+    def new_client_session_id():
+        return uuid.uuid4().hex
+
+    def acquire(self, client_session_id):
+        session = self._active.get(client_session_id)
+        if session is None:
+            session = self._sessions.get(client_session_id)  # get 会检查过期
+            if session is None:
+                session = _AgentSession()
+            else:
+                self._sessions.pop(client_session_id)
+        if session.inflight >= self.max_inflight:
+            raise SessionBusyError(client_session_id)
+        session.inflight += 1
+        self._active[client_session_id] = session
+        return session
+
+    def release(self, client_session_id, session):
+        session.inflight -= 1
+        if session.inflight == 0:
+            # set 会刷新过期时间和 LRU 顺序（空闲 TTL 从这里开始算）
+            self._active.pop(client_session_id, None)
+            self._sessions.set(client_session_id, session)
+
+    @asynccontextmanager
+    async def turn(self, client_session_id):
+        session = self.acquire(client_session_id)
+        try:
+            yield session.agent_session_id
+        finally:
+            self.release(client_session_id, session)
+
+    def stats(self):
+        stats = self._sessions.stats()
+        stats["active"] = len(self._active)
+        return stats
@@ -0,0 +1,35 @@
+import time
+
+# 本地开发・测试用的 bedrock-agent-runtime 桩（不连接 AWS）
+_CATEGORY_INVOCATION = {"a": "ACTION_GROUP", "c": "KNOWLEDGE_BASE"}
+
+
+class FakeAgentClient:
+    """
+    只实现 invoke_agent 的假客户端。
+    回答按 chunk_size 字节切成 chunk 返回（和真实接口一样，可能切断多字节字符）。
+    category 为 "a" / "c" 时先返回一条 orchestrationTrace。
+    指定 delay 时每个 chunk 之间等待，可用于确认流式显示。
+    """
+
+    def __init__(self, answer="（テスト用の回答）エージェントの回答はここに表示されます。", category="b",
+                 chunk_size=7, delay=0.0):
+        self.answer = answer
+        self.category = category
+        self.chunk_size = chunk_size
+        self.delay = delay
+        self.calls = []
+
+    def _events(self):
+        invocation = _CATEGORY_INVOCATION.get(self.category)
+        if invocation:
+            yield {"trace": {"trace": {"orchestrationTrace": {"invocationInput": {"invocationType": invocation}}}}}
+        data = self.answer.encode("utf-8")
+        for start in range(0, len(data), self.chunk_size):
+            if self.delay:
+                time.sleep(self.delay)
+            yield {"chunk": {"bytes": data[start:start + self.chunk_size]}}
+
+    def invoke_agent(self, **kwargs):
+        self.calls.append(kwargs)
+        return {"completion": self._events(), "sessionId": kwargs.get("sessionId")}
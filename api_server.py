@@ -1,20 +1,27 @@
 import traceback
-from fastapi import FastAPI, Request, HTTPException
+from fastapi import FastAPI, HTTPException
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from pydantic import BaseModel
-from finetuned_model.load_classifier import load_model_and_tokenizer, classify_review
-from finetuned_model.load_generator import load_generation_model, generate_text
-from create_order.llm_parser import parse_order_from_text
+from finetuned_model.load_classifier import load_model_and_tokenizer, classify_review, classify_batch, WEIGHTS_PATH as CLASSIFIER_WEIGHTS_PATH
+from finetuned_model.classification_cache import ClassificationCache, normalize_text, model_fingerprint
+from finetuned_model.load_generator import load_generation_model, generate_text, BASE_CONFIG as GEN_CONFIG
+from finetuned_model.generation_engine import GenerationEngine, generate_text_async, stream_text_async
+from create_order.llm_parser import parse_order_from_text, extraction_cache
 from create_order.order_pdf import router as order_pdf_router
-from rag.rag_retriever import real_rag_answer
-from agent.agent_chatter import run_bedrock_agent
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.responses import Response
-import time
+from rag.rag_retriever import rag_service
+from agent.agent_chatter import run_bedrock_agent_async, stream_bedrock_agent
+from agent.agent_sessions import AgentSessionPool, SessionBusyError
+from commons.batching import MicroBatcher
+from commons.rate_limit import RateLimiter, MemoryBucketBackend, SQLiteBucketBackend
+from commons.middleware import RateLimitAndPathFilterMiddleware
+import json
 
 from create_order.schemas import OrderDraft, Order
-from create_order.dialogue import calc_missing, next_question, apply_single_answer, to_order_if_complete
+from create_order.dialogue import (calc_missing, next_question, related_fields, apply_answers, to_order_if_complete,
+                                   add_item, remove_item, item_field, ITEM_FIELDS)
+from create_order.validation import sign_order
+from create_order.dialogue_store import DialogueState, MemoryDialogueStore, SQLiteDialogueStore
 
 from typing import List, Optional
 
@@ -23,48 +30,79 @@ app.include_router(order_pdf_router)
 
 # ========== 配置 ==========
 RATE_LIMIT = 60  # 每个 IP 每分钟最多请求次数
+ROUTE_RATE_LIMITS = {  # 按路径前缀单独限流（每个 IP 每分钟），比默认更严格；同时计入 RATE_LIMIT 的全体额度
+    "/api/generate": 10,
+    "/api/agent_chat": 10,
+    "/api/rag_qa": 10,  # 含 /api/rag_qa_stream
+    "/agent/order": 20,
+    "/orders/pdf": 20,
+}
+RATE_LIMIT_DB = None  # 多个 uvicorn worker 共享限流额度时设为 SQLite 文件路径，例: "/tmp/ratelimit.sqlite3"
 ALLOWED_PATH_PREFIX = "/api"
+PREDICT_MAX_BATCH_SIZE = 16  # /api/predict 微批处理：每批最多条数
+PREDICT_MAX_WAIT_MS = 5      # /api/predict 微批处理：攒批最长等待（毫秒）
+PREDICT_BATCH_MAX_TEXTS = 1000  # /api/predict_batch 单次请求最多条数
+GENERATE_MAX_BATCH_SIZE = 8  # /api/generate 连续批处理：同时解码的最大序列数
+PREDICT_CACHE_SIZE = 100000     # 分类结果缓存：内存中最多条数
+PREDICT_CACHE_TTL = 24 * 3600   # 分类结果缓存：过期秒数
+PREDICT_CACHE_DB = None         # 分类结果二级缓存（SQLite 文件路径，None 为不使用），例: "predict_cache.sqlite3"
+AGENT_MAX_SESSIONS = 1000        # Agent 会话池：最多保留的会话数（LRU 淘汰）
+AGENT_SESSION_IDLE_TTL = 1800    # Agent 会话池：空闲过期秒数
+AGENT_MAX_INFLIGHT_PER_SESSION = 1  # Agent 会话池：同一会话同时进行的轮次上限
+ORDER_DIALOGUE_MAX_SESSIONS = 10000  # 注文对话：最多保留的对话数（LRU 淘汰）
+ORDER_DIALOGUE_TTL = 1800            # 注文对话：无操作过期秒数
+ORDER_DIALOGUE_DB = None             # 多 worker 共享对话状态时设为 SQLite 文件路径，例: "/tmp/order_dialogues.sqlite3"
+QUANTIZE_INT8 = False  # True: 分类/生成模型以动态 int8 量化加载（CPU，省内存、提速；精度对比见 finetuned_model/quantization.py）
 
 # ========== 内部存储 ==========
-ip_access_log = {}  # 存储 IP 的访问时间戳
+# 令牌桶限流器（每次请求 O(1)，空闲 IP 自动淘汰）
+rate_limiter = RateLimiter(
+    default_limit=RATE_LIMIT,
+    route_limits=ROUTE_RATE_LIMITS,
+    backend=SQLiteBucketBackend(RATE_LIMIT_DB) if RATE_LIMIT_DB else MemoryBucketBackend(),
+)
 
 ALLOWED_PATH_PREFIXES = ["/api", "/", "/index.html", "/favicon.ico", "/static"]  # 保留主页、静态文件等
 
 BLOCKED_PATTERNS = [".php", ".aspx", "/wp-", "/admin", "/config", "/log", "/radio"]
 
-class RateLimitAndPathFilterMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        client_ip = request.client.host
-        path = request.url.path
-
-        # ❌ 拒绝明显的攻击路径
-        for pattern in BLOCKED_PATTERNS:
-            if pattern in path:
-                return Response(status_code=403, content=f"Forbidden: Suspicious path {path}")
-
-        # ✅ 允许的路径前缀
-        if not any(path.startswith(p) for p in ALLOWED_PATH_PREFIXES):
-            return Response(status_code=403, content="Forbidden: Path not allowed.")
-
-        # Rate Limit 限制
-        now = time.time()
-        timestamps = ip_access_log.get(client_ip, [])
-        timestamps = [t for t in timestamps if now - t < 60]
-        if len(timestamps) >= RATE_LIMIT:
-            return Response(status_code=429, content="Too Many Requests: Rate limit exceeded.")
-        timestamps.append(now)
-        ip_access_log[client_ip] = timestamps
-
-        return await call_next(request)
-
-# 添加中间件
-app.add_middleware(RateLimitAndPathFilterMiddleware)
+# 添加中间件（纯 ASGI 实现，见 commons/middleware.py）
+app.add_middleware(
+    RateLimitAndPathFilterMiddleware,
+    rate_limiter=rate_limiter,
+    blocked_patterns=BLOCKED_PATTERNS,
+    allowed_prefixes=ALLOWED_PATH_PREFIXES,
+)
 
 # 应用启动时加载一次模型和 tokenizer
-model, tokenizer, device = load_model_and_tokenizer()
+model, tokenizer, device = load_model_and_tokenizer(quantize=QUANTIZE_INT8)
+
+# 分类结果缓存（key = 规范化文本 + 模型版本；换 checkpoint 或切换 int8/fp32 自动失效）
+classification_cache = ClassificationCache(
+    model_fingerprint(CLASSIFIER_WEIGHTS_PATH, quantized=QUANTIZE_INT8),
+    maxsize=PREDICT_CACHE_SIZE,
+    ttl=PREDICT_CACHE_TTL,
+    sqlite_path=PREDICT_CACHE_DB,
+)
+
+# 并发的分类请求合并成一次批量前向
+predict_batcher = MicroBatcher(
+    lambda texts: classify_batch(texts, model, tokenizer, device, pad_to_longest=False),
+    max_batch_size=PREDICT_MAX_BATCH_SIZE,
+    max_wait_ms=PREDICT_MAX_WAIT_MS,
+)
 
 # 加载生成模型
-gen_model, gen_tokenizer = load_generation_model()
+gen_model, gen_tokenizer = load_generation_model(quantize=QUANTIZE_INT8)
+
+# 生成请求在后台线程里做连续批处理（有空位就把新请求加入正在解码的批次）
+gen_engine = GenerationEngine(
+    gen_model,
+    context_size=GEN_CONFIG["context_length"],
+    eos_id=50256,
+    max_batch_size=GENERATE_MAX_BATCH_SIZE,
+    max_new_tokens=35,
+)
 
 # 请求体模型
 class PredictRequest(BaseModel):
@@ -75,6 +113,13 @@ class PredictResponse(BaseModel):
     label: str
     confidence: float
 
+class PredictBatchRequest(BaseModel):
+    texts: List[str]
+    pad_to_longest: bool = False  # True：按批内最长文本补齐（更快，但结果可能与 /api/predict 不同）
+
+class PredictBatchResponse(BaseModel):
+    results: List[PredictResponse]
+
 class GenerateRequest(BaseModel):
     prompt: str
 
@@ -89,25 +134,88 @@ def read_index():
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 @app.post("/api/predict", response_model=PredictResponse)
-def predict(req: PredictRequest):
-    predicted_label, confidence_score = classify_review(req.text, model, tokenizer, device)
+async def predict(req: PredictRequest):
+    text = normalize_text(req.text)
+    result = await classification_cache.aget(text)  # L2（SQLite）查找在线程里进行，不阻塞事件循环
+    if result is None:
+        result = await predict_batcher.submit(text)
+        await classification_cache.aput(text, result)
+    predicted_label, confidence_score = result
     return PredictResponse(label=predicted_label, confidence=confidence_score)
 
+@app.post("/api/predict_batch", response_model=PredictBatchResponse)
+def predict_batch(req: PredictBatchRequest):
+    """
+    批量分类。默认与 /api/predict 相同：补齐到 max_length、读取最后一个位置（与微调时一致），
+    结果相同，共用同一份缓存。
+    pad_to_longest=True 时只补齐到批内最长文本、读取各自最后一个真实 token：短文本更快，
+    但分类头是按补齐后的最后位置训练的，标签 / 置信度可能不同，因此缓存单独分开。
+    """
+    if len(req.texts) > PREDICT_BATCH_MAX_TEXTS:
+        raise HTTPException(status_code=413, detail=f"Too many texts: at most {PREDICT_BATCH_MAX_TEXTS} per request.")
+    results = classification_cache.classify_many(
+        [normalize_text(text) for text in req.texts],
+        lambda texts: classify_batch(texts, model, tokenizer, device, pad_to_longest=req.pad_to_longest),
+        variant="pad_to_longest" if req.pad_to_longest else "",
+    )
+    return PredictBatchResponse(results=[
+        PredictResponse(label=label, confidence=confidence) for label, confidence in results
+    ])
+
+@app.get("/api/predict/cache_stats")
+def predict_cache_stats():
+    return classification_cache.stats()
+
 @app.post("/api/generate", response_model=GenerateResponse)
-def generate(req: GenerateRequest):
-    result = generate_text(req.prompt, gen_model, gen_tokenizer)
+async def generate(req: GenerateRequest):
+    result = await generate_text_async(req.prompt, gen_engine, gen_tokenizer)
     return GenerateResponse(response=result)
 
+@app.post("/api/generate_stream")
+async def generate_stream(req: GenerateRequest):
+    """
+    /api/generate 的流式版本（Server-Sent Events）：每生成一段文本推送一次 data 事件，结束时推送 done 事件。
+    """
+    async def event_stream():
+        try:
+            async for text in stream_text_async(req.prompt, gen_engine, gen_tokenizer):
+                yield f"data: {json.dumps({'token': text}, ensure_ascii=False)}\n\n"
+        except Exception as e:
+            traceback.print_exc()
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)}, ensure_ascii=False)}\n\n"
+            return
+        yield "event: done\ndata: {}\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
 # === RAG用 ===
 class RAGRequest(BaseModel):
     query: str
 
 @app.post("/api/rag_qa")
-def rag_qa(req: RAGRequest):
-    # ↓ あなたのRAG推論ロジックに置き換えてください
-    answer = real_rag_answer(req.query)
+async def rag_qa(req: RAGRequest):
+    # 检索与生成由 LangChain 放到默认线程池执行（每条链约占一个线程）；同时运行的链数由 rag_service 限制在线程池的一半以内
+    answer = await rag_service.answer(req.query)
     return {"answer": answer}
 
+@app.post("/api/rag_qa_stream")
+async def rag_qa_stream(req: RAGRequest):
+    """
+    /api/rag_qa 的流式版本（Server-Sent Events）：生成的回答片段到达即推送。
+    """
+    async def event_stream():
+        async for kind, value in rag_service.stream(req.query):
+            if kind == "chunk":
+                yield f"data: {json.dumps({'token': value}, ensure_ascii=False)}\n\n"
+            else:
+                yield f"event: error\ndata: {json.dumps({'detail': value}, ensure_ascii=False)}\n\n"
+                return
+        yield "event: done\ndata: {}\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
 def fake_rag_answer(query: str) -> str:
     # 仮実装（あなたのretrieval+LLM生成に差し替えてOK）
     if "Honda" in query:
@@ -117,26 +225,84 @@ def fake_rag_answer(query: str) -> str:
 # === Agent用 ===
 class AgentRequest(BaseModel):
     message: str
+    session_id: Optional[str] = None  # 上次响应返回的会话 ID；首次为空
+
+# 每个客户端会话对应一个独立的 Bedrock Agent 会话
+agent_sessions = AgentSessionPool(
+    maxsize=AGENT_MAX_SESSIONS,
+    idle_ttl=AGENT_SESSION_IDLE_TTL,
+    max_inflight=AGENT_MAX_INFLIGHT_PER_SESSION,
+)
 
 @app.post("/api/agent_chat")
 async def agent_chat(req: AgentRequest):
     prompt = req.message
-    result = run_bedrock_agent(prompt)
+    client_session_id = req.session_id or agent_sessions.new_client_session_id()
+    try:
+        async with agent_sessions.turn(client_session_id) as agent_session_id:
+            result = await run_bedrock_agent_async(prompt, agent_session_id=agent_session_id)
+    except SessionBusyError:
+        raise HTTPException(status_code=429, detail="前の質問への回答を生成中です。完了までお待ちください。")
     #return {"answer": answer}
     return {
         "answer": result["text"],
-        "category": result["category"]
+        "category": result["category"],
+        "session_id": client_session_id
     }
 
+@app.post("/api/agent_chat_stream")
+async def agent_chat_stream(req: AgentRequest):
+    """
+    /api/agent_chat 的流式版本（Server-Sent Events）：Agent 的回答片段到达即推送，结束时 done 事件带上分类。
+    """
+    client_session_id = req.session_id or agent_sessions.new_client_session_id()
+
+    async def event_stream():
+        category = "b"
+        try:
+            async with agent_sessions.turn(client_session_id) as agent_session_id:
+                async for kind, value in stream_bedrock_agent(req.message, agent_session_id=agent_session_id):
+                    if kind == "chunk":
+                        yield f"data: {json.dumps({'token': value}, ensure_ascii=False)}\n\n"
+                    elif kind == "category":
+                        category = value
+                    else:
+                        yield f"event: error\ndata: {json.dumps({'detail': value}, ensure_ascii=False)}\n\n"
+                        return
+        except SessionBusyError:
+            detail = "前の質問への回答を生成中です。完了までお待ちください。"
+            yield f"event: error\ndata: {json.dumps({'detail': detail}, ensure_ascii=False)}\n\n"
+            return
+        yield f"event: done\ndata: {json.dumps({'category': category, 'session_id': client_session_id})}\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
 # ===== 新規追加: 注文書生成 =====
 class StartReq(BaseModel):
     text: str
     template_id: str = "invoice_default_v1"
+    multi_field: bool = False  # True：一次问多个相关字段，一次回答可填多个字段
 
 class StepReq(BaseModel):
-    draft: dict          # 前端携带当前的 OrderDraft JSON
-    field: str           # 这次回答的是哪个字段（上次返回给你的）
-    answer: str          # 用户的回答
+    session_id: str               # /agent/order/start 返回的对话 ID（草稿保存在服务器端）
+    answer: str                   # 用户的回答
+    field: Optional[str] = None   # 回答的是哪个字段；省略时为上一次提问的字段（多字段模式下为全部）
+
+class ItemAddReq(BaseModel):
+    session_id: str
+    answer: Optional[str] = None  # 新明细的内容（可省略，之后按问题逐项回答）
+
+class ItemRemoveReq(BaseModel):
+    session_id: str
+    index: int                    # 要删除的明细下标（0 起算）
+
+# 注文对话的草稿保存在服务器端，前端每轮只发送 session_id + 回答
+order_dialogues = (
+    SQLiteDialogueStore(ORDER_DIALOGUE_DB, maxsize=ORDER_DIALOGUE_MAX_SESSIONS, ttl=ORDER_DIALOGUE_TTL)
+    if ORDER_DIALOGUE_DB else
+    MemoryDialogueStore(maxsize=ORDER_DIALOGUE_MAX_SESSIONS, ttl=ORDER_DIALOGUE_TTL)
+)
 
 class OrderRequest(BaseModel):
     text: str
@@ -154,6 +320,10 @@ def create_order(req: OrderRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"注文書生成に失敗しました: {str(e)}")
 
+@app.get("/agent/order/cache_stats")
+def order_extraction_cache_stats():
+    return {"extraction": extraction_cache.stats(), "dialogues": order_dialogues.stats()}
+
 @app.post("/agent/order/start")
 def order_start(req: StartReq):
     """
@@ -164,57 +334,111 @@ def order_start(req: StartReq):
         missing = calc_missing(draft)
         if not missing:
             done, order = to_order_if_complete(draft)
-            if done: return {"status":"done", "order": order.model_dump()}
-        field = missing[0]
+            if done: return order_done_response(order)
+        fields = related_fields(missing) if req.multi_field else missing[:1]
+        session_id = order_dialogues.create(DialogueState(draft=draft, fields=fields, multi_field=req.multi_field))
         return {
             "status": "ask",
-            "question": next_question(field),
-            "field": field,
-            "draft": draft.model_dump(by_alias=True, exclude_none=True, mode="json")
+            "question": next_question(fields),
+            "field": fields[0],
+            "fields": fields,
+            "session_id": session_id,
         }
     except Exception as e:
         # 打印完整的 stack trace 到控制台/日志
         traceback.print_exc()
         raise HTTPException(500, f"解析失败: {e}")
 
-@app.post("/agent/order/reply")
-def order_reply(req: StepReq):
+def order_done_response(order: Order) -> dict:
+    # 附带签名：前端原样提交到 /orders/pdf（X-Order-Token）时不必再校验一遍
+    order_json = order.model_dump(by_alias=True, mode="json")
+    return {"status": "done", "order": order_json, "order_token": sign_order(order_json)}
+
+def get_order_dialogue(session_id: str) -> DialogueState:
+    state = order_dialogues.get(session_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail="対話の有効期限が切れました。最初からやり直してください。")
+    return state
+
+def order_dialogue_step(session_id: str, state: DialogueState) -> dict:
     """
-    后续轮次：只填当前字段，生成新的 draft；若已齐全则返回最终 order。
+    草稿更新后：还有缺失 → 问下一个（组）字段；已齐全 → 返回最终 order 并结束对话。
+    调用方需持有 order_dialogues.session_lock(session_id)。
     """
-    try:
-        payload = dict(req.draft or {})
-        
-        draft = OrderDraft(**payload)
-        draft2 = apply_single_answer(draft, req.field, req.answer)
-
-        # 计算缺失项
-        missing = calc_missing(draft2)
-
-        # 1) 还有缺失 → 继续问下一个字段
-        if missing:  # 非空才取 missing[0]
-            field = missing[0]
-            return {
-                "status": "ask",
-                "question": next_question(field),
-                "field": field,
-                "draft": draft2.model_dump(by_alias=True, exclude_none=True, mode="json"),
-            }
-
-        # 2) 看是否已经可以生成最终订单
-        done, order = to_order_if_complete(draft2)
-        if done:
-            return {"status":"done", "order": order.model_dump(by_alias=True, mode="json")}
-
-        # 3) 防御式兜底：
-        #    如果 missing 为空但仍未 done，说明 calc_missing 与 to_order_if_complete 存在不一致或数据异常
+    draft = state.draft
+
+    # 计算缺失项
+    missing = calc_missing(draft)
+
+    # 1) 还有缺失 → 继续问下一个字段
+    if missing:  # 非空才取 missing[0]
+        state.fields = related_fields(missing) if state.multi_field else missing[:1]
+        order_dialogues.save(session_id, state)
         return {
             "status": "ask",
-            "question": "入力を確認できませんでした。もう一度ご回答ください。",
-            "field": req.field,  # 或者给个固定的首要字段，如 "buyer.name"
-            "draft": draft2.model_dump(by_alias=True, exclude_none=True, mode="json"),
+            "question": next_question(state.fields),
+            "field": state.fields[0],
+            "fields": state.fields,
+            "session_id": session_id,
         }
 
+    # 2) 看是否已经可以生成最终订单
+    done, order = to_order_if_complete(draft)
+    if done:
+        order_dialogues.delete(session_id)
+        return order_done_response(order)
+
+    # 3) 防御式兜底：
+    #    如果 missing 为空但仍未 done，说明 calc_missing 与 to_order_if_complete 存在不一致或数据异常
+    order_dialogues.save(session_id, state)
+    return {
+        "status": "ask",
+        "question": "入力を確認できませんでした。もう一度ご回答ください。",
+        "field": state.fields[0],  # 或者给个固定的首要字段，如 "buyer.name"
+        "fields": state.fields,
+        "session_id": session_id,
+    }
+
+@app.post("/agent/order/reply")
+def order_reply(req: StepReq):
+    """
+    后续轮次：填入这次问到的字段（多字段模式下一次回答可填多个；服务器端的 draft 原地更新）；
+    若已齐全则返回最终 order。
+    """
+    try:
+        # 同一会话的并发请求串行处理（草稿是共享对象，原地修改）
+        with order_dialogues.session_lock(req.session_id):
+            state = get_order_dialogue(req.session_id)
+
+            # 草稿原地更新，不再整份重建 / 重新校验
+            apply_answers(state.draft, [req.field] if req.field else state.fields, req.answer)
+
+            return order_dialogue_step(req.session_id, state)
+
+    except HTTPException:
+        raise
     except Exception as e:
         traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"更新失败: {e}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"更新失败: {e}")
+
+@app.post("/agent/order/item/add")
+def order_item_add(req: ItemAddReq):
+    """
+    追加一个明细。answer 不为空时直接用它填新明细（例：“CD-22、ノート、10冊、@200”），
+    然后与 reply 一样返回下一个问题或最终 order。
+    """
+    with order_dialogues.session_lock(req.session_id):
+        state = get_order_dialogue(req.session_id)
+        index = add_item(state.draft)
+        if req.answer:
+            apply_answers(state.draft, [item_field(index, attr) for attr in ITEM_FIELDS], req.answer)
+        return order_dialogue_step(req.session_id, state)
+
+@app.post("/agent/order/item/remove")
+def order_item_remove(req: ItemRemoveReq):
+    """删除第 index 个明细（0 起算），返回下一个问题或最终 order"""
+    with order_dialogues.session_lock(req.session_id):
+        state = get_order_dialogue(req.session_id)
+        if not remove_item(state.draft, req.index):
+            raise HTTPException(status_code=400, detail=f"明細 {req.index + 1} 行目は存在しません。")
+        return order_dialogue_step(req.session_id, state)
@@ -0,0 +1,59 @@
+import asyncio
+
+
+class MicroBatcher:
+    """
+    把并发的单条请求在 max_wait_ms 内攒成一批，调用一次 batch_fn(list) 后再把结果分发回各请求。
+    batch_fn 是同步函数（例如模型前向），在线程中执行，不阻塞事件循环。
+    """
+
+    def __init__(self, batch_fn, max_batch_size=16, max_wait_ms=5):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = None
+        self._worker = None
+
+    def _ensure_worker(self):
+        # 懒启动：第一次 submit 时在当前事件循环里创建队列和后台任务
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def submit(self, item):
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            # 已被取消的请求（客户端断开）不再参与计算
+            batch = [(item, fut) for item, fut in batch if not fut.done()]
+            if not batch:
+                continue
+            try:
+                results = await asyncio.to_thread(self.batch_fn, [item for item, _ in batch])
+            except Exception as e:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            for (_, fut), result in zip(batch, results):
+                if not fut.done():
+                    fut.set_result(result)
@@ -0,0 +1,126 @@
+"""
+路径过滤 + 限流中间件的每请求开销微基准（不走网络，直接调用 ASGI 应用）。
+
+    python -m commons.bench_middleware [请求数]
+
+before:        旧实现（BaseHTTPMiddleware + 两个 Python 循环 + 时间戳列表）
+asgi:          commons.middleware.RateLimitAndPathFilterMiddleware（纯 ASGI + 预编译正则），限流仍用时间戳列表
+asgi+bucket:   同上，限流换成 commons.rate_limit.RateLimiter（令牌桶）
+before→asgi 是中间件改动的收益，asgi→asgi+bucket 是限流实现改动的收益，分开报告。
+"""
+import sys
+import time
+import asyncio
+from starlette.applications import Starlette
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import PlainTextResponse, Response
+from starlette.routing import Route
+from commons.middleware import RateLimitAndPathFilterMiddleware
+from commons.rate_limit import RateLimiter
+
+ALLOWED_PATH_PREFIXES = ["/api", "/", "/index.html", "/favicon.ico", "/static"]
+BLOCKED_PATTERNS = [".php", ".aspx", "/wp-", "/admin", "/config", "/log", "/radio"]
+RATE_LIMIT = 60        # 和 api_server.py 相同的每分钟上限
+BENCH_CLIENTS = 1000   # 轮流访问的客户端 IP 数；每个 IP 的请求数保持在上限以内，不触发 429
+
+
+class SlidingWindowLimiter:
+    """旧实现的限流逻辑（每个 IP 一个时间戳列表，每次请求过滤一遍），接口和 RateLimiter 相同"""
+
+    def __init__(self, limit=RATE_LIMIT, period=60):
+        self.limit = limit
+        self.period = period
+        self.ip_access_log = {}
+
+    def allow(self, client_key, path):
+        now = time.time()
+        timestamps = self.ip_access_log.get(client_key, [])
+        timestamps = [t for t in timestamps if now - t < self.period]
+        if len(timestamps) >= self.limit:
+            return False
+        timestamps.append(now)
+        self.ip_access_log[client_key] = timestamps
+        return True
+
+    async def allow_async(self, client_key, path):
+        return self.allow(client_key, path)
+
+
+class LegacyMiddleware(BaseHTTPMiddleware):
+    def __init__(self, app):
+        super().__init__(app)
+        self.rate_limiter = SlidingWindowLimiter()
+
+    async def dispatch(self, request, call_next):
+        client_ip = request.client.host
+        path = request.url.path
+        for pattern in BLOCKED_PATTERNS:
+            if pattern in path:
+                return Response(status_code=403, content=f"Forbidden: Suspicious path {path}")
+        if not any(path.startswith(p) for p in ALLOWED_PATH_PREFIXES):
+            return Response(status_code=403, content="Forbidden: Path not allowed.")
+        if not self.rate_limiter.allow(client_ip, path):
+            return Response(status_code=429, content="Too Many Requests: Rate limit exceeded.")
+        return await call_next(request)
+
+
+def build_app(middleware):
+    async def ping(request):
+        return PlainTextResponse("ok")
+
+    app = Starlette(routes=[Route("/api/ping", ping)])
+    if middleware == "before":
+        app.add_middleware(LegacyMiddleware)
+    elif middleware in ("asgi", "asgi+bucket"):
+        rate_limiter = SlidingWindowLimiter() if middleware == "asgi" else RateLimiter(default_limit=RATE_LIMIT)
+        app.add_middleware(
+            RateLimitAndPathFilterMiddleware,
+            rate_limiter=rate_limiter,
+            blocked_patterns=BLOCKED_PATTERNS,
+            allowed_prefixes=ALLOWED_PATH_PREFIXES,
+        )
+    return app
+
+
+async def call(app, path, client_ip):
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "",
+        "query_string": b"", "headers": [], "client": (client_ip, 12345), "server": ("bench", 80),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    await app(scope, receive, send)
+
+
+async def bench(app, n):
+    # 预热：每个客户端先访问一次
+    for i in range(BENCH_CLIENTS):
+        await call(app, "/api/ping", f"10.0.{i // 256}.{i % 256}")
+    start = time.perf_counter()
+    for i in range(n):
+        c = i % BENCH_CLIENTS
+        await call(app, "/api/ping", f"10.0.{c // 256}.{c % 256}")
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    if n // BENCH_CLIENTS + 1 >= RATE_LIMIT:
+        sys.exit(f"请求数请小于 {(RATE_LIMIT - 1) * BENCH_CLIENTS}（超过后会触发 429，测的就不是放行路径了）")
+    results = {name: asyncio.run(bench(build_app(name), n)) for name in ("none", "before", "asgi", "asgi+bucket")}
+    for name, us in results.items():
+        print(f"{name:>11}: {us:8.1f} µs/request")
+    print(f"pure ASGI middleware: {results['before'] - results['asgi']:+.1f} µs saved "
+          f"(before {results['before'] - results['none']:.1f} → {results['asgi'] - results['none']:.1f} µs overhead)")
+    print(f"token bucket limiter: {results['asgi'] - results['asgi+bucket']:+.1f} µs saved "
+          f"(sliding window {results['asgi'] - results['none']:.1f} → {results['asgi+bucket'] - results['none']:.1f} µs overhead)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import re
+from starlette.responses import Response
+
+
+class PathFilter:
+    """
+    把 BLOCKED_PATTERNS（子串）和 ALLOWED_PATH_PREFIXES（前缀）各编译成一个正则，
+    每个请求只做一次 search + 一次 match，不再逐个循环。
+    """
+
+    def __init__(self, blocked_patterns, allowed_prefixes):
+        self._blocked = re.compile("|".join(map(re.escape, blocked_patterns))) if blocked_patterns else None
+        self._allowed = re.compile("|".join(map(re.escape, allowed_prefixes))) if allowed_prefixes else None
+
+    def is_blocked(self, path):
+        return self._blocked is not None and self._blocked.search(path) is not None
+
+    def is_allowed(self, path):
+        return self._allowed is None or self._allowed.match(path) is not None
+
+
+class RateLimitAndPathFilterMiddleware:
+    """
+    纯 ASGI 中间件（不经过 BaseHTTPMiddleware）：被拒绝的请求直接返回 403/429，
+    放行的请求原样交给下游，不包装 receive/send，流式响应（StreamingResponse / SSE）不受影响。
+    """
+
+    def __init__(self, app, rate_limiter, blocked_patterns, allowed_prefixes):
+        self.app = app
+        self.rate_limiter = rate_limiter
+        self.path_filter = PathFilter(blocked_patterns, allowed_prefixes)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        path = scope["path"]
+        client = scope.get("client")
+        client_ip = client[0] if client else "unknown"
+
+        # ❌ 拒绝明显的攻击路径
+        if self.path_filter.is_blocked(path):
+            response = Response(status_code=403, content=f"Forbidden: Suspicious path {path}")
+        # ✅ 允许的路径前缀
+        elif not self.path_filter.is_allowed(path):
+            response = Response(status_code=403, content="Forbidden: Path not allowed.")
+        # Rate Limit 限制
+        elif not await self.rate_limiter.allow_async(client_ip, path):
+            response = Response(status_code=429, content="Too Many Requests: Rate limit exceeded.")
+        else:
+            await self.app(scope, receive, send)
+            return
+
+        await response(scope, receive, send)
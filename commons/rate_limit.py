@@ -0,0 +1,119 @@
+import time
+import asyncio
+import sqlite3
+import threading
+from collections import OrderedDict
+
+
+class MemoryBucketBackend:
+    """
+    进程内令牌桶存储。key 按最近访问排序，每次访问顺带淘汰队头空闲超过 idle_ttl 的 key
+    （均摊 O(1)，不做全表扫描）。只对单个 worker 进程有效。
+    """
+
+    def __init__(self, idle_ttl=600):
+        self.idle_ttl = idle_ttl
+        self.blocking = False  # 纯内存操作，可直接在事件循环里调用
+        self._buckets = OrderedDict()  # key -> [tokens, updated]
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, capacity, now):
+        with self._lock:
+            bucket = self._buckets.pop(key, None)
+            if bucket is None:
+                bucket = [capacity, now]
+            tokens = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+            allowed = tokens >= 1
+            self._buckets[key] = [tokens - 1 if allowed else tokens, now]
+
+            while self._buckets:
+                oldest_key, (_, updated) = next(iter(self._buckets.items()))
+                if now - updated <= self.idle_ttl:
+                    break
+                del self._buckets[oldest_key]
+            return allowed
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class SQLiteBucketBackend:
+    """
+    基于 SQLite 文件的令牌桶存储，同一台机器上的多个 uvicorn worker 共用一份额度。
+    每次 take 在一个 IMMEDIATE 事务里读改写；每 evict_interval 秒删除一次空闲 key。
+    会阻塞（文件锁），由 RateLimiter.allow_async 放到线程里执行；
+    其它 worker 持锁超过 busy_timeout 秒时放行这次请求（fail open），不让限流拖慢请求。
+    """
+
+    def __init__(self, path, idle_ttl=600, evict_interval=60, busy_timeout=0.1):
+        self.idle_ttl = idle_ttl
+        self.evict_interval = evict_interval
+        self.blocking = True
+        self._next_evict = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=busy_timeout, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS rate_buckets (key TEXT PRIMARY KEY, tokens REAL, updated REAL)"
+        )
+
+    def take(self, key, rate, capacity, now):
+        with self._lock:
+            try:
+                self._db.execute("BEGIN IMMEDIATE")
+            except sqlite3.OperationalError:
+                return True  # database is locked：放行
+            try:
+                row = self._db.execute("SELECT tokens, updated FROM rate_buckets WHERE key = ?", (key,)).fetchone()
+                tokens = capacity if row is None else min(capacity, row[0] + (now - row[1]) * rate)
+                allowed = tokens >= 1
+                self._db.execute(
+                    "INSERT OR REPLACE INTO rate_buckets VALUES (?, ?, ?)",
+                    (key, tokens - 1 if allowed else tokens, now)
+                )
+                if now >= self._next_evict:
+                    self._db.execute("DELETE FROM rate_buckets WHERE updated < ?", (now - self.idle_ttl,))
+                    self._next_evict = now + self.evict_interval
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+            return allowed
+
+
+class RateLimiter:
+    """
+    令牌桶限流：每个 (路由组, 客户端) 一个桶，每次请求 O(1)。
+    default_limit / route_limits 的值为每分钟允许的请求数；route_limits 的 key 是路径前缀，最长前缀优先。
+    每个客户端另有一个全体桶（default_limit），所有请求都计入，
+    所以各路由组的额度加起来也不会超过 default_limit。
+    """
+
+    def __init__(self, default_limit=60, route_limits=None, backend=None, period=60):
+        self.period = period
+        self.default_limit = default_limit
+        # 最长前缀优先匹配
+        self.route_limits = sorted((route_limits or {}).items(), key=lambda kv: -len(kv[0]))
+        # 空闲到桶被补满后，记录可以安全丢弃
+        self.backend = backend or MemoryBucketBackend(idle_ttl=period)
+
+    def _route(self, path):
+        for prefix, limit in self.route_limits:
+            if path.startswith(prefix):
+                return prefix, limit
+        return "*", self.default_limit
+
+    def allow(self, client_key, path):
+        now = time.time()
+        route, limit = self._route(path)
+        # 先查路由组的桶：被它拒绝的请求不消耗全体额度
+        if route != "*" and not self.backend.take(f"{route}|{client_key}", limit / self.period, limit, now):
+            return False
+        return self.backend.take(f"*|{client_key}", self.default_limit / self.period, self.default_limit, now)
+
+    async def allow_async(self, client_key, path):
+        # 会阻塞的 backend（SQLite）放到线程里，不占住事件循环；内存 backend 直接调用
+        if getattr(self.backend, "blocking", False):
+            return await asyncio.to_thread(self.allow, client_key, path)
+        return self.allow(client_key, path)
@@ -1,5 +1,7 @@
 # create_order/__init__.py
 from .schemas import Order, OrderDraft
-from .dialogue import calc_missing, next_question, apply_single_answer, to_order_if_complete
+from .dialogue import (calc_missing, next_question, related_fields, apply_single_answer, apply_answers,
+                       add_item, remove_item, to_order_if_complete)
 
-__all__ = ["Order", "OrderDraft", "calc_missing", "next_question", "apply_single_answer", "to_order_if_complete"]
+__all__ = ["Order", "OrderDraft", "calc_missing", "next_question", "related_fields", "apply_single_answer",
+           "apply_answers", "add_item", "remove_item", "to_order_if_complete"]
@@ -0,0 +1,103 @@
+import os
+import json
+import time
+import random
+import threading
+from botocore.exceptions import ClientError
+
+# 只有这些错误码值得重试（限流 / 暂时过载）；参数错误等重试也不会成功
+THROTTLING_ERROR_CODES = {
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "ServiceUnavailableException",
+}
+
+
+def error_code(e: Exception) -> str:
+    if isinstance(e, ClientError):
+        return e.response.get("Error", {}).get("Code", "")
+    return ""
+
+
+def is_unsupported_parameter(e: Exception, param: str) -> bool:
+    """
+    ValidationException 且错误信息里点名了 param（例："extraneous key [response_format] is not permitted"）。
+    提示词过长等其它 ValidationException 与参数是否支持无关，不算。
+    """
+    if error_code(e) != "ValidationException":
+        return False
+    message = e.response.get("Error", {}).get("Message", "") or str(e)
+    return param.lower() in message.lower()
+
+
+class ModelCapabilities:
+    """
+    记住每个 MODEL_ID 是否接受 response_format（进程内共享，可选持久化到 JSON 文件）。
+    不支持的模型失败后就不再带 response_format，省掉每次请求多一次失败的往返。
+    每条记录带探测时间，超过 ttl 秒视为未探测，重新试一次（模型升级后可能变为支持）。
+    """
+
+    def __init__(self, path=None, ttl=24 * 3600):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._supports = {}  # model_id -> {"supported": bool, "checked_at": 时间戳}
+        if path and os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    self._supports = {
+                        k: {"supported": bool(v["supported"]), "checked_at": float(v["checked_at"])}
+                        for k, v in json.load(f).items()
+                    }
+            except (OSError, ValueError, KeyError, TypeError):
+                self._supports = {}  # 旧格式 / 损坏的文件：全部重新探测
+
+    def supports_response_format(self, model_id):
+        """True / False / None（尚未探测或记录已过期）"""
+        with self._lock:
+            entry = self._supports.get(model_id)
+        if entry is None or time.time() - entry["checked_at"] > self.ttl:
+            return None
+        return entry["supported"]
+
+    def record(self, model_id, supported: bool):
+        now = time.time()
+        with self._lock:
+            entry = self._supports.get(model_id)
+            # 结果没变且记录未过期就不写文件（支持的模型每次调用都会 record）
+            if entry and entry["supported"] == supported and now - entry["checked_at"] <= self.ttl / 2:
+                return
+            self._supports[model_id] = {"supported": supported, "checked_at": now}
+            snapshot = dict(self._supports)
+        if self.path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            # 临时文件名带进程 ID + 线程 ID：多个 worker / 线程同时写时互不覆盖
+            tmp_path = f"{self.path}.tmp{os.getpid()}.{threading.get_ident()}"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(snapshot, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+
+
+class BedrockInvoker:
+    """
+    Bedrock 调用的客户端侧控制：
+    - max_concurrency：同时在途的 invoke_model 上限（超出的线程排队等待）
+    - 仅对限流类错误做指数退避重试（full jitter），最多 max_attempts 次
+    """
+
+    def __init__(self, max_concurrency=4, max_attempts=4, base_delay=0.5, max_delay=8.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+
+    def call(self, fn, *args, **kwargs):
+        for attempt in range(self.max_attempts):
+            try:
+                with self._semaphore:
+                    return fn(*args, **kwargs)
+            except ClientError as e:
+                if error_code(e) not in THROTTLING_ERROR_CODES or attempt == self.max_attempts - 1:
+                    raise
+            # 退避期间不占并发名额
+            time.sleep(random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt)))
@@ -0,0 +1,67 @@
+"""
+每份注文書 PDF 的渲染耗时（同一进程内直接调用 WeasyPrint）。
+
+    python -m create_order.bench_pdf_render [份数]
+
+cold: 每次新建 Jinja 环境并取模板、解析 CSS、新建字体配置（相当于旧实现）
+warm: 复用 TemplateCache / StyleCache 中的模板、CSS 和字体配置
+"""
+import os
+import sys
+import time
+from datetime import date
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from weasyprint import HTML, CSS
+from weasyprint.text.fonts import FontConfiguration
+from .schemas import Order
+from .order_pdf import render_order_html
+from .render_context import StyleCache, TEMPLATE_FILES, DEFAULT_TEMPLATE_ID, TEMPLATES_DIR, STATIC_DIR, PAGE_CSS
+
+SAMPLE_ORDER = Order(
+    issue_date=date(2025, 1, 31),
+    seller={"name": "default seller name"},
+    buyer={"name": "株式会社テスト"},
+    items=[{"sku": f"ABC-{i:03d}", "name": f"ボールペン {i}", "qty": i + 1, "unit_price": 120} for i in range(10)],
+)
+
+
+def render_cold(order):
+    html_name, css_name = TEMPLATE_FILES[DEFAULT_TEMPLATE_ID]
+    env = Environment(loader=FileSystemLoader(TEMPLATES_DIR), autoescape=select_autoescape(["html", "xml"]))
+    env.get_template(html_name)  # 相当于旧实现的 get_template
+    html_str = render_order_html(order)
+    font_config = FontConfiguration()
+    stylesheets = [
+        CSS(filename=os.path.join(TEMPLATES_DIR, css_name), base_url=STATIC_DIR, font_config=font_config),
+        CSS(string=PAGE_CSS, font_config=font_config),
+    ]
+    return HTML(string=html_str, base_url=STATIC_DIR).write_pdf(stylesheets=stylesheets, font_config=font_config)
+
+
+def render_warm(order, style_cache):
+    html_str = render_order_html(order)
+    font_config, stylesheets = style_cache.get(order.template_id)
+    return HTML(string=html_str, base_url=STATIC_DIR).write_pdf(stylesheets=stylesheets, font_config=font_config)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    style_cache = StyleCache()
+    render_warm(SAMPLE_ORDER, style_cache)  # 预热
+
+    start = time.perf_counter()
+    for _ in range(n):
+        render_cold(SAMPLE_ORDER)
+    cold_ms = (time.perf_counter() - start) / n * 1000
+
+    start = time.perf_counter()
+    for _ in range(n):
+        render_warm(SAMPLE_ORDER, style_cache)
+    warm_ms = (time.perf_counter() - start) / n * 1000
+
+    print(f"cold: {cold_ms:.1f} ms/PDF")
+    print(f"warm: {warm_ms:.1f} ms/PDF  (saving {cold_ms - warm_ms:.1f} ms, {1 - warm_ms / cold_ms:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+規則ベース抽出（rule_extractor）だけで処理できる注文依頼の割合を測る。
+
+    python -m create_order.bench_rule_extractor
+
+CORPUS: 典型的な注文依頼。expected があるものは規則だけで完結すべき依頼で、抽出値も照合する。
+expected=None は LLM に回すべき依頼（複数明細・送料・支払条件など）。
+"""
+import time
+from .dialogue import calc_missing
+from .llm_parser import RULE_CONFIDENCE_THRESHOLD
+from .rule_extractor import extract_order_rules
+
+
+def _exp(buyer, sku, name, qty, price):
+    return {"buyer.name": buyer, "items[0].sku": sku, "items[0].name": name,
+            "items[0].qty": qty, "items[0].unit_price": price}
+
+
+CORPUS = [
+    ("ABC-123のボールペンを5個、単価120円で山田さんへ", _exp("山田", "ABC-123", "ボールペン", 5, "120")),
+    ("ＡＢＣ－１２３のボールペンを５個、単価１２０円で山田さんへ", _exp("山田", "ABC-123", "ボールペン", 5, "120")),
+    ("XY-9001のノートPCを3台、単価149,800円。発注者は佐藤です", _exp("佐藤", "XY-9001", "ノートPC", 3, "149800")),
+    ("型番 KB-204 キーボード 10台 単価4,980円 株式会社テスト様", _exp("株式会社テスト", "KB-204", "キーボード", 10, "4980")),
+    ("モニター（MN-2701）を2台、1台あたり32,000円で鈴木様宛てにお願いします", _exp("鈴木", "MN-2701", "モニター", 2, "32000")),
+    ("田中さんにPEN-01の赤ペンを20本、単価80円で", _exp("田中", "PEN-01", "赤ペン", 20, "80")),
+    ("SKU: CB-550 の USBケーブルを 30本、@350 で 高橋さん", _exp("高橋", "CB-550", "USBケーブル", 30, "350")),
+    ("品名：コピー用紙 型番：PP-A4500 数量：12箱 単価：2,400円 請求先：山本商事株式会社",
+     _exp("山本商事株式会社", "PP-A4500", "コピー用紙", 12, "2400")),
+    ("DSK-1200のデスクを4台、単価¥45,000で伊藤様へ", _exp("伊藤", "DSK-1200", "デスク", 4, "45000")),
+    ("CH-300の椅子を8脚、単価12000円で渡辺さん", _exp("渡辺", "CH-300", "椅子", 8, "12000")),
+    ("ABC-123のボールペンを5個とNB-10のノートを10冊、山田さんへ", None),
+    ("ABC-123のボールペンを5個、単価120円、送料500円で山田さんへ", None),
+    ("ABC-123のボールペンを5個、単価120円で山田さんへ。支払は銀行振込で", None),
+    ("ABC-123のボールペンを5個、単価120円で山田さんへ。納期は3月15日", None),
+    ("ABC-123のボールペンを5個、単価120円で山田さんへ。3/15までに", None),
+    ("至急 ABC-123のボールペンを5個、単価120円で山田さんへ", None),
+    ("ボールペンを5個ください", None),
+    ("いつものやつを先月と同じだけ", None),
+    ("ABC-123を5個、山田さんへ", None),
+    ("ABC-123のボールペン、単価120円で山田さんへ", None),
+    ("LP-880のノートパソコンを2台、単価98,000円、yamada@example.co.jp の山田さんへ", None),
+    ("TN-45のトナーを6本、単価7,800円で、経理部の小林様", _exp("小林", "TN-45", "トナー", 6, "7800")),
+]
+
+
+def main():
+    start = time.perf_counter()
+    results = [extract_order_rules(text) for text, _ in CORPUS]
+    elapsed_ms = (time.perf_counter() - start) / len(CORPUS) * 1000
+
+    served = 0
+    wrong = []
+    for (text, expected), (draft, confidence) in zip(CORPUS, results):
+        fast = confidence >= RULE_CONFIDENCE_THRESHOLD and not calc_missing(draft)
+        served += fast
+        it = draft.items[0]
+        got = {"buyer.name": draft.buyer.name if draft.buyer else None, "items[0].sku": it.sku,
+               "items[0].name": it.name, "items[0].qty": it.qty,
+               "items[0].unit_price": format(it.unit_price.normalize(), "f") if it.unit_price else None}
+        if fast != (expected is not None) or (fast and got != expected):
+            wrong.append((text, confidence, got))
+        print(f"{'RULE' if fast else 'LLM ':4} {confidence:.2f}  {text}")
+
+    print(f"\nserved without LLM: {served}/{len(CORPUS)} ({served / len(CORPUS):.0%}), "
+          f"{elapsed_ms:.3f} ms/request")
+    for text, confidence, got in wrong:
+        print(f"MISMATCH {confidence:.2f} {text}\n    {got}")
+
+
+if __name__ == "__main__":
+    main()
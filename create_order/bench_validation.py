@@ -0,0 +1,66 @@
+"""
+每个请求的 Order / OrderDraft 校验开销（明细 1 / 50 / 500 行）。
+
+    python -m create_order.bench_validation [重复次数]
+
+pdf  before: json.loads + Order(**dict)（旧的 /orders/pdf）
+pdf  json:   缓存的 TypeAdapter.validate_json（未签名的请求）
+pdf  signed: 验签 + 可信构造（对话结束时签发的 order 原样提交）
+draft before: OrderDraft(**dict)（旧的抽取缓存命中 / SQLite 对话状态读取）
+draft trusted: construct_draft
+"""
+import sys
+import json
+import time
+from datetime import date
+from .schemas import Order, OrderDraft
+from .validation import validate_order_json, construct_order, construct_draft, sign_order, verify_order
+
+
+def sample_order_json(n_items):
+    order = Order(
+        order_id="PO-0001",
+        issue_date=date(2025, 1, 31),
+        seller={"name": "default seller name"},
+        buyer={"name": "株式会社テスト", "email": "yamada@example.co.jp"},
+        items=[{"sku": f"ABC-{i:03d}", "name": f"ボールペン {i}", "qty": i + 1, "unit_price": "120.50"}
+               for i in range(n_items)],
+    )
+    return order.model_dump(by_alias=True, mode="json")
+
+
+def timeit(fn, repeat):
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    print(f"{'items':>6} {'pdf before':>12} {'pdf json':>10} {'pdf signed':>11} {'draft before':>13} {'draft trusted':>14}  (µs/request)")
+    for n_items in (1, 50, 500):
+        order_json = sample_order_json(n_items)
+        body = json.dumps(order_json, ensure_ascii=False).encode("utf-8")
+        token = sign_order(order_json)
+        draft_json = OrderDraft(**order_json).model_dump(mode="json", exclude_none=True)
+        n = max(5, repeat // max(1, n_items // 10))  # 明细越多重复次数越少
+
+        def pdf_signed():
+            data = json.loads(body)
+            assert verify_order(data, token)
+            return construct_order(data)
+
+        results = [
+            timeit(lambda: Order(**json.loads(body)), n),
+            timeit(lambda: validate_order_json(body), n),
+            timeit(pdf_signed, n),
+            timeit(lambda: OrderDraft(**draft_json), n),
+            timeit(lambda: construct_draft(draft_json), n),
+        ]
+        print(f"{n_items:>6} " + " ".join(f"{r:>{w}.1f}" for r, w in zip(results, (12, 10, 11, 13, 14))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import io
+import asyncio
+import zipfile
+from collections import deque
+from .pdf_renderer import PdfRenderBusy, PdfRenderTimeout
+
+
+class _ChunkSink(io.RawIOBase):
+    """不可 seek 的写入目标：zipfile 写入的字节先攒在这里，每写完一个文件取走一次"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+async def _render_when_free(pool, html_str, base_url, template_id):
+    # 批量任务不返回 503，进程池满时稍等再提交
+    while True:
+        try:
+            return await pool.render(html_str, base_url, template_id)
+        except PdfRenderBusy:
+            await asyncio.sleep(0.2)
+
+
+async def _render_job(pool, make_html, base_url, template_id):
+    # 失败时返回异常对象而不是抛出，一个注文失败不影响后面的注文
+    try:
+        return await _render_when_free(pool, make_html(), base_url, template_id)
+    except Exception as e:
+        return e
+
+
+async def render_in_order(jobs, pool, base_url, window):
+    """
+    jobs: 可迭代的 (文件名, 生成 HTML 的函数, template_id)。
+    最多 window 个任务并行渲染，按输入顺序逐个 yield (文件名, PDF 字节)；渲染失败的注文 yield (文件名, 异常)。
+    HTML 在提交前才生成，已 yield 的 PDF 不再保留。
+    """
+    pending = deque()
+
+    def submit(job):
+        name, make_html, template_id = job
+        task = asyncio.ensure_future(_render_job(pool, make_html, base_url, template_id))
+        pending.append((name, task))
+
+    try:
+        for job in jobs:
+            submit(job)
+            if len(pending) >= window:
+                name, task = pending.popleft()
+                yield name, await task
+        while pending:
+            name, task = pending.popleft()
+            yield name, await task
+    finally:
+        # 客户端断开等提前结束时，取消尚未完成的渲染
+        for _, task in pending:
+            task.cancel()
+
+
+def _error_entry(name, error):
+    # 响应头已经发出，无法再改状态码：失败的注文在 ZIP 里放一个说明文件代替 PDF
+    if isinstance(error, PdfRenderTimeout):
+        message = "PDF生成がタイムアウトしました。"
+    else:
+        message = f"PDF生成に失敗しました: {type(error).__name__} {error}".rstrip()
+    return f"{name.removesuffix('.pdf')}.ERROR.txt", message + "\n"
+
+
+async def stream_zip(named_pdfs):
+    """
+    把 (文件名, PDF 字节) 逐个写进 ZIP，每写完一个就把这部分字节 yield 出去。
+    渲染失败的注文写成 <文件名>.ERROR.txt，其余注文照常输出。
+    """
+    sink = _ChunkSink()
+    # PDF 本身已压缩，用 STORED 省 CPU
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED) as zf:
+        async for name, pdf_bytes in named_pdfs:
+            if isinstance(pdf_bytes, Exception):
+                name, pdf_bytes = _error_entry(name, pdf_bytes)
+            zf.writestr(name, pdf_bytes)
+            yield sink.drain()
+    yield sink.drain()
+
+
+async def merge_pdfs(named_pdfs) -> bytes:
+    """
+    合并为一个 PDF。PDF 的交叉引用表在文件末尾，无法边渲染边输出，
+    所以在全部页面完成后一次性写出（需要 pypdf）。
+    """
+    from pypdf import PdfReader, PdfWriter
+
+    writer = PdfWriter()
+    async for _, pdf_bytes in named_pdfs:
+        if isinstance(pdf_bytes, Exception):
+            raise pdf_bytes  # 还没开始响应，整体按错误返回
+        writer.append(PdfReader(io.BytesIO(pdf_bytes)))
+    out = io.BytesIO()
+    writer.write(out)
+    return out.getvalue()
@@ -1,11 +1,14 @@
+import re
 import json
 import traceback
 from typing import List, Tuple
+from functools import lru_cache
 from .schemas import OrderDraft, Order, Party, PartyDraft, OrderItemDraft
-from pydantic import ValidationError
+from pydantic import ValidationError, TypeAdapter
 from datetime import date
 from decimal import Decimal, InvalidOperation
-from typing import Optional
+from typing import Optional, Union, Annotated
+from .rule_extractor import normalize, QTY_RE, PRICE_RE, HONORIFIC_RE, COMPANY_RE, strip_honorific
 
 def extract_json(raw: str) -> dict:
     """
@@ -24,6 +27,17 @@ def extract_json(raw: str) -> dict:
             raise ValueError("未找到有效的 JSON 片段")
         return json.loads(raw[start:end + 1])
     
+ITEM_FIELDS = ("sku", "name", "qty", "unit_price")   # 每个明细的必填项
+_ITEM_FIELD_RE = re.compile(r"^items\[(\d+)\]\.(\w+)$")
+
+def item_field(index: int, attr: str) -> str:
+    return f"items[{index}].{attr}"
+
+def parse_item_field(field: str) -> Tuple[Optional[int], Optional[str]]:
+    """"items[3].qty" → (3, "qty")；不是明细字段时返回 (None, None)"""
+    m = _ITEM_FIELD_RE.match(field)
+    return (int(m.group(1)), m.group(2)) if m else (None, None)
+
 def calc_missing(d: OrderDraft) -> List[str]:
     missing = []
 
@@ -31,30 +45,100 @@ def calc_missing(d: OrderDraft) -> List[str]:
     if not (d.buyer and d.buyer.name):
         missing.append("buyer.name")
 
-    # items[0] 必填项（含 sku）
+    # 所有明细的必填项（含 sku），一次线性扫描
     if not (d.items and len(d.items) > 0):
-        missing += ["items[0].sku", "items[0].name", "items[0].qty", "items[0].unit_price"]
+        missing += [item_field(0, attr) for attr in ITEM_FIELDS]
     else:
-        it0 = d.items[0]
-        if not it0.sku:  missing.append("items[0].sku")
-        if not it0.name: missing.append("items[0].name")
-        if not it0.qty or (isinstance(it0.qty, int) and it0.qty <= 0):
-            missing.append("items[0].qty")
-        if not it0.unit_price:
-            missing.append("items[0].unit_price")
+        for i, it in enumerate(d.items):
+            if not it.sku:  missing.append(item_field(i, "sku"))
+            if not it.name: missing.append(item_field(i, "name"))
+            if not it.qty or (isinstance(it.qty, int) and it.qty <= 0):
+                missing.append(item_field(i, "qty"))
+            if not it.unit_price:
+                missing.append(item_field(i, "unit_price"))
 
     return missing
 
-def next_question(field: str) -> str:
-    # 日文提问模板
-    mapping = {
-        "buyer.name": "発注者の氏名を教えてください。",
-        "items[0].sku": "品目コードを教えてください。",
-        "items[0].name": "品目名を教えてください。",
-        "items[0].qty": "数量はいくつですか？（半角の正の整数）",
-        "items[0].unit_price": "単価はいくらですか？（税抜/税込のどちらでも。半角数字、例：49800）",
-    }
-    return mapping.get(field, f"{field} を教えてください。")
+# 日文提问模板（明细字段按属性名，第 2 行以后加 “N行目の”）
+QUESTIONS = {
+    "buyer.name": "発注者の氏名を教えてください。",
+    "sku": "品目コードを教えてください。",
+    "name": "品目名を教えてください。",
+    "qty": "数量はいくつですか？（半角の正の整数）",
+    "unit_price": "単価はいくらですか？（税抜/税込のどちらでも。半角数字、例：49800）",
+}
+QUESTION_LABELS = {
+    "buyer.name": "発注者の氏名",
+    "sku": "品目コード",
+    "name": "品目名",
+    "qty": "数量",
+    "unit_price": "単価",
+}
+
+def _item_prefix(index: int) -> str:
+    return "" if index == 0 else f"{index + 1}行目の"
+
+def _field_group(field: str) -> str:
+    # "items[0].qty" → "items[0]"；buyer / seller 等表头字段归为同一组
+    head = field.split(".", 1)[0]
+    return head if head.startswith("items[") else "header"
+
+def related_fields(missing: List[str]) -> List[str]:
+    """
+    可以一次一起问的缺失字段：表头字段（发注者等）+ 第一个未填完的明细的字段。
+    missing 按明细顺序排列，遇到第二个明细就停止，明细再多也只看开头几项。
+    """
+    groups = []
+    fields = []
+    for f in missing:
+        g = _field_group(f)
+        if g not in groups:
+            if groups and (g != "header" and groups[-1] != "header" or len(groups) == 2):
+                break
+            groups.append(g)
+        fields.append(f)
+    return fields
+
+def _labels(fields: List[str]) -> str:
+    # 同一明细的字段只在第一个前面加 “N行目の”
+    parts = []
+    last_index = None
+    for f in fields:
+        index, attr = parse_item_field(f)
+        if index is None:
+            parts.append(QUESTION_LABELS.get(f, f))
+        else:
+            prefix = _item_prefix(index) if index != last_index else ""
+            parts.append(prefix + QUESTION_LABELS.get(attr, attr))
+        last_index = index
+    return "、".join(parts)
+
+def next_question(field: Union[str, List[str]]) -> str:
+    if isinstance(field, list):
+        if len(field) != 1:
+            # 多个字段合并成一个问题（一次回答即可全部填上）
+            return f"{_labels(field)}を教えてください。（読点区切りでまとめて回答できます。例：SKU AB-1、ボールペン、3個、単価5000円）"
+        field = field[0]
+    index, attr = parse_item_field(field)
+    if index is None:
+        return QUESTIONS.get(field, f"{field} を教えてください。")
+    if attr in QUESTIONS:
+        return _item_prefix(index) + QUESTIONS[attr]
+    return f"{field} を教えてください。"
+
+def add_item(d: OrderDraft, item: Optional[OrderItemDraft] = None) -> int:
+    """在末尾追加一个明细，返回其下标"""
+    if d.items is None:
+        d.items = []
+    d.items.append(item or OrderItemDraft())
+    return len(d.items) - 1
+
+def remove_item(d: OrderDraft, index: int) -> bool:
+    """删除第 index 个明细（后面的明细下标依次前移）"""
+    if not d.items or not 0 <= index < len(d.items):
+        return False
+    del d.items[index]
+    return True
 
 def canonical_field(field: str) -> str:
     if field == "seller":
@@ -63,10 +147,53 @@ def canonical_field(field: str) -> str:
         return "buyer.name"
     return field
 
+def parse_qty(t: str) -> Optional[int]:
+    # 允许 “5個”“3台” 等：提取数字
+    digits = "".join(ch for ch in t if ch.isdigit())
+    if digits:
+        q = int(digits)
+        if q > 0:
+            return q
+    return None
+
+def parse_price(t: str) -> Optional[Decimal]:
+    # 允许 “8,000円” “8000.00” 等：提取数字和小数点
+    digits = "".join(ch for ch in t if ch.isdigit() or ch == ".")
+    if digits:
+        try:
+            price = Decimal(digits)
+        except InvalidOperation:
+            return None
+        if price > 0:
+            return price
+    return None
+
+@lru_cache(maxsize=None)
+def _field_adapter(model, attr) -> TypeAdapter:
+    # 字段自身的类型 + 约束（gt / max_digits / decimal_places 等），按 (模型, 字段) 缓存
+    f = model.model_fields[attr]
+    return TypeAdapter(Annotated[(f.annotation, *f.metadata)] if f.metadata else f.annotation)
+
+def _assign(obj, attr: str, value) -> bool:
+    """
+    校验后再写入：草稿是原地更新的，不经过模型整体校验，
+    违反字段约束的值（如 “100.555円” 的单价）在这里拒绝，该字段保持未填，下一轮重新提问。
+    """
+    if value is None:
+        return False
+    try:
+        value = _field_adapter(type(obj), attr).validate_python(value)
+    except ValidationError:
+        return False
+    setattr(obj, attr, value)
+    return True
+
 def apply_single_answer(d: OrderDraft, field: str, text: Optional[str]) -> OrderDraft:
     t = (text or "").strip()
     field = canonical_field(field)
 
+    index, attr = parse_item_field(field)
+
     # 确保子模型存在（都是 *Draft）
     if d.seller is None:
         d.seller = PartyDraft()
@@ -74,43 +201,126 @@ def apply_single_answer(d: OrderDraft, field: str, text: Optional[str]) -> Order
         d.buyer = PartyDraft()
     if not d.items:
         d.items = [OrderItemDraft()]
+    if index is not None and index == len(d.items):
+        d.items.append(OrderItemDraft())  # 回答下一行 = 追加明细；更远的下标忽略
 
     # ---- 填值 ----
     if field == "seller.name":
-        d.seller.name = t
+        _assign(d.seller, "name", t)
 
     elif field == "buyer.name":
-        d.buyer.name = t
-
-    elif field == "items[0].sku":
-        d.items[0].sku = t
-        
-    elif field == "items[0].name":
-        d.items[0].name = t
-
-    elif field == "items[0].qty":
-        # 允许 “5個”“3台” 等：提取数字
-        digits = "".join(ch for ch in t if ch.isdigit())
-        if digits:
-            try:
-                q = int(digits)
-                if q > 0:
-                    d.items[0].qty = q
-            except:
-                pass
-
-    elif field == "items[0].unit_price":
-        # 允许 “8,000円” “8000.00” 等：提取数字和小数点
-        digits = "".join(ch for ch in t if ch.isdigit() or ch == ".")
-        if digits:
-            try:
-                d.items[0].unit_price = Decimal(digits)
-            except:
-                pass
-
-
-    # 返回新的 Draft（用字段名而非 alias 重建，避免键名错位）
-    return OrderDraft(**d.model_dump(by_alias=False, exclude_none=True))
+        _assign(d.buyer, "name", t)
+
+    elif index is None or index >= len(d.items):
+        pass
+
+    elif attr in ("sku", "name"):
+        _assign(d.items[index], attr, t)
+
+    elif attr == "qty":
+        _assign(d.items[index], "qty", parse_qty(t))
+
+    elif attr == "unit_price":
+        _assign(d.items[index], "unit_price", parse_price(t))
+
+    # 原地更新（对话状态保存在服务器端，不必整份重建；每个值在 _assign 里按字段约束校验）
+    return d
+
+# 回答按读点等切分后，各部分开头的标签 → 字段
+_LABEL_WORDS = {
+    "sku": "SKU|型番|品番|品目コード",
+    "name": "品名|商品名|品目名?",
+    "qty": "数量|個数",
+    "unit_price": "単価|価格",
+    "buyer.name": "発注者|購入者|宛先|請求先|お名前|氏名",
+}
+_ANSWER_LABELS = [(re.compile(rf"^(?:{words})\s*[:は]?\s*"), key) for key, words in _LABEL_WORDS.items()]
+# 读点/分号/换行处切分；逗号只在不是千位分隔符时切分；空格后紧跟标签时也切分
+_SEGMENT_SPLIT = re.compile(
+    r"[、;；\n]+|,(?!\d{3}(?:\D|$))|\s+(?=(?:" + "|".join(_LABEL_WORDS.values()) + r")\s*[:は]?)"
+)
+_BARE_NUMBER = re.compile(r"^\d[\d,]*(?:\.\d+)?$")
+# 回答里单独出现的 SKU（比注文全文抽取时宽松，允许 “AB-1” 这样的短编号）
+_ANSWER_SKU = re.compile(r"[A-Z]{1,6}-?[A-Z]{0,2}\d{1,8}(?:-[A-Z0-9]{1,6})?")
+
+def _get_field(d: OrderDraft, field: str):
+    party, _, attr = field.partition(".")
+    if party in ("buyer", "seller"):
+        p = getattr(d, party)
+        return getattr(p, attr) if p else None
+    index, attr = parse_item_field(field)
+    if index is not None and d.items and index < len(d.items):
+        return getattr(d.items[index], attr, None)
+    return None
+
+def _set_answer(d: OrderDraft, field: str, value: str) -> bool:
+    apply_single_answer(d, field, value)
+    return _get_field(d, field) not in (None, "")
+
+def _classify_segment(seg: str):
+    """
+    回答的一部分 → (种类 或 None, 值字符串)。
+    种类为明细属性名（sku / name / qty / unit_price）或 "buyer.name"；None 表示看不出是哪个字段
+    """
+    for pattern, key in _ANSWER_LABELS:
+        m = pattern.match(seg)
+        if m:
+            return key, seg[m.end():]
+    if _ANSWER_SKU.fullmatch(seg):
+        return "sku", seg
+    if QTY_RE.fullmatch(seg):
+        return "qty", seg
+    if PRICE_RE.fullmatch(seg):
+        return "unit_price", seg
+    if HONORIFIC_RE.fullmatch(seg) or COMPANY_RE.fullmatch(seg):
+        return "buyer.name", strip_honorific(seg)
+    return None, seg
+
+def apply_answers(d: OrderDraft, fields: List[str], text: Optional[str]) -> List[str]:
+    """
+    一次自由回答填多个字段（例：“SKU AB-1、3個、単価5000円”）。
+    - 能从标签（単価：…）或形式（SKU 格式、带助数词的数字、带“円”的金额、◯◯さん）判断字段的部分，
+      即使不是这次问的字段也会填上（明细字段填进这次问到的那一行）
+    - 判断不出的部分，按顺序填进这次问到但还没填上的字段
+      （纯数字：数量 → 单价；文字：品名 / 发注者 / SKU）
+    返回：填上的字段
+    """
+    fields = [canonical_field(f) for f in fields]
+    if len(fields) == 1:
+        # 只问了一个字段时与以前相同：整个回答就是该字段的值
+        return fields if _set_answer(d, fields[0], text) else []
+
+    # 这次问到的明细行（没有问明细时为第 1 行）
+    index = next((i for i, _ in map(parse_item_field, fields) if i is not None), 0)
+
+    def target(key):
+        return key if key == "buyer.name" else item_field(index, key)
+
+    filled = []
+    pending = []
+    for seg in _SEGMENT_SPLIT.split(normalize(text)):
+        seg = seg.strip()
+        if not seg:
+            continue
+        key, value = _classify_segment(seg)
+        if key is None or target(key) in filled:
+            pending.append(value)
+            continue
+        if _set_answer(d, target(key), value):
+            filled.append(target(key))
+
+    for value in pending:
+        if _BARE_NUMBER.match(value):
+            # 带逗号/小数点的优先当单价，否则优先当数量
+            keys = ["unit_price", "qty"] if ("," in value or "." in value) else ["qty", "unit_price"]
+        else:
+            keys = ["name", "buyer.name", "sku"]
+        for key in keys:
+            field = target(key)
+            if field in fields and field not in filled and _set_answer(d, field, value):
+                filled.append(field)
+                break
+    return filled
 
 def to_strict_order(d: OrderDraft) -> Order:
     """
@@ -123,6 +333,9 @@ def to_strict_order(d: OrderDraft) -> Order:
     # 交给严格的 Pydantic Order 校验
     return Order(**data)
 
+# 固定值，模块加载时校验、构造一次即可
+DEFAULT_SELLER = Party(name="default seller name")
+
 def to_order_if_complete(d: OrderDraft) -> Tuple[bool, Order | None]:
     # 还有缺失就直接 False
     missing = calc_missing(d)
@@ -141,7 +354,7 @@ def to_order_if_complete(d: OrderDraft) -> Tuple[bool, Order | None]:
     # （可选）再做一次日文到代码的映射
     data["currency"] = "JPY"
     data["payment_method"] = "BANK_TRANSFER"
-    data["seller"] = Party(**{"name": "default seller name"})
+    data["seller"] = DEFAULT_SELLER
 
     try:
         order = Order(**data)  # 严格校验（含 enum + 金额 + email 等）
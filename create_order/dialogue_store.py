@@ -0,0 +1,132 @@
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from dataclasses import dataclass
+from typing import List, Optional
+from commons.cache import TTLCache
+from .schemas import OrderDraft
+from .validation import construct_draft
+
+
+@dataclass
+class DialogueState:
+    draft: OrderDraft          # 当前的注文草稿（在服务器端原地更新）
+    fields: List[str]          # 上一次提问的字段（多字段模式下可能有多个）
+    multi_field: bool = False  # 是否一次问多个相关字段
+
+
+def new_session_id() -> str:
+    return uuid.uuid4().hex
+
+
+class SessionLocks:
+    """
+    session_id → 锁。同一会话的“读取 → 修改草稿 → 保存”必须串行（草稿是原地修改的）；
+    按哈希分到固定数量的锁上，锁的数量不随会话数增长。只在单个进程内有效。
+    """
+
+    def __init__(self, stripes=64):
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+    def __call__(self, session_id) -> threading.Lock:
+        return self._locks[hash(session_id) % len(self._locks)]
+
+
+class MemoryDialogueStore:
+    """
+    注文对话状态的内存存储（LRU + TTL）。保存的是 OrderDraft 对象本身，
+    每轮对话不需要序列化 / Pydantic 重新校验。单进程部署用。
+    """
+
+    def __init__(self, maxsize=10000, ttl=1800):
+        self._states = TTLCache(maxsize=maxsize, ttl=ttl)
+        # get 返回的是共享对象：修改前后要持有 session_lock(session_id)
+        self.session_lock = SessionLocks()
+
+    def create(self, state: DialogueState) -> str:
+        session_id = new_session_id()
+        self._states.set(session_id, state)
+        return session_id
+
+    def get(self, session_id) -> Optional[DialogueState]:
+        return self._states.get(session_id)
+
+    def save(self, session_id, state: DialogueState):
+        # 对象已原地更新，这里只刷新 TTL 与 LRU 顺序
+        self._states.set(session_id, state)
+
+    def delete(self, session_id):
+        self._states.pop(session_id)
+
+    def stats(self):
+        return self._states.stats()
+
+
+class SQLiteDialogueStore:
+    """
+    同样接口的 SQLite 存储，多个 uvicorn worker 共享对话状态、或需要重启后继续对话时使用。
+    草稿以 JSON 保存，读取时按可信数据直接构造 OrderDraft（不重新校验）。
+    """
+
+    def __init__(self, path, maxsize=10000, ttl=1800):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.session_lock = SessionLocks()  # 只串行化本进程内的请求；多个 worker 之间仍以最后一次 save 为准
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS order_dialogues ("
+                "session_id TEXT PRIMARY KEY, fields TEXT, multi_field INTEGER, draft_json TEXT, updated REAL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS order_dialogues_updated ON order_dialogues(updated)")
+
+    @staticmethod
+    def _dump(draft: OrderDraft) -> str:
+        return json.dumps(draft.model_dump(mode="json", exclude_none=True), ensure_ascii=False)
+
+    def _write(self, session_id, state: DialogueState):
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO order_dialogues VALUES (?, ?, ?, ?, ?)",
+                (session_id, json.dumps(state.fields), int(state.multi_field), self._dump(state.draft), time.time())
+            )
+
+    def create(self, state: DialogueState) -> str:
+        session_id = new_session_id()
+        self._write(session_id, state)
+        with self._lock, self._db:
+            # 过期的和超出 maxsize 的（最久未更新的）一起清掉
+            self._db.execute("DELETE FROM order_dialogues WHERE updated < ?", (time.time() - self.ttl,))
+            self._db.execute(
+                "DELETE FROM order_dialogues WHERE session_id IN ("
+                "SELECT session_id FROM order_dialogues ORDER BY updated DESC LIMIT -1 OFFSET ?)",
+                (self.maxsize,)
+            )
+        return session_id
+
+    def get(self, session_id) -> Optional[DialogueState]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT fields, multi_field, draft_json, updated FROM order_dialogues WHERE session_id = ?",
+                (session_id,)
+            ).fetchone()
+        if row is None or time.time() - row[3] > self.ttl:
+            return None
+        return DialogueState(draft=construct_draft(json.loads(row[2])), fields=json.loads(row[0]),
+                             multi_field=bool(row[1]))
+
+    def save(self, session_id, state: DialogueState):
+        self._write(session_id, state)
+
+    def delete(self, session_id):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM order_dialogues WHERE session_id = ?", (session_id,))
+
+    def stats(self):
+        with self._lock:
+            (count,) = self._db.execute("SELECT COUNT(*) FROM order_dialogues").fetchone()
+        return {"size": count, "maxsize": self.maxsize, "ttl": self.ttl}
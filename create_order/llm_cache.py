@@ -0,0 +1,90 @@
+import os
+import re
+import time
+import json
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from commons.cache import TTLCache
+
+_WHITESPACE = re.compile(r"[^\S\n]+")  # 换行以外的空白
+
+
+def normalize_request(text: str) -> str:
+    # NFKC 统一全角/半角，行内连续空白合并为一个空格，去掉空行；
+    # 换行保留（明细一行一件的依赖靠它区分品目）。发给 LLM 的也是规范化后的文本，缓存与实时结果一致
+    lines = (_WHITESPACE.sub(" ", line).strip() for line in unicodedata.normalize("NFKC", text or "").splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def prompt_namespace(model_id: str, *prompts: str) -> str:
+    """模型 ID + 提示词哈希。换模型或改 SYSTEM_JA / USER_TEMPLATE_JA 后旧缓存自动失效"""
+    digest = hashlib.sha256("\0".join(prompts).encode("utf-8")).hexdigest()[:16]
+    return f"{model_id}:{digest}"
+
+
+class ExtractionCache:
+    """
+    规范化后的注文依赖文本 → LLM 抽取出的 OrderDraft（JSON 字符串）。
+    L1 为进程内 LRU/TTL，L2 为 SQLite 文件（可选，重启后仍有效）。
+    temperature=0，同一输入 + 同一模型 + 同一提示词的输出视为不变。
+    """
+
+    def __init__(self, namespace, maxsize=10000, ttl=30 * 24 * 3600, sqlite_path=None):
+        self.namespace = namespace
+        self.ttl = ttl
+        self._memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.l2_hits = 0
+        self._db = None
+        self._db_lock = threading.Lock()
+        if sqlite_path:
+            os.makedirs(os.path.dirname(os.path.abspath(sqlite_path)), exist_ok=True)
+            self._db = sqlite3.connect(sqlite_path, check_same_thread=False)
+            with self._db_lock, self._db:
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS extraction_cache ("
+                    "key TEXT PRIMARY KEY, namespace TEXT, draft_json TEXT, created REAL)"
+                )
+                # 旧模型/旧提示词写入的行不会再命中
+                self._db.execute("DELETE FROM extraction_cache WHERE namespace != ?", (namespace,))
+
+    def _key(self, normalized_text):
+        return hashlib.sha256(f"{self.namespace}\0{normalized_text}".encode("utf-8")).hexdigest()
+
+    def get(self, normalized_text):
+        key = self._key(normalized_text)
+        draft_json = self._memory.get(key)
+        if draft_json is not None or self._db is None:
+            return draft_json
+
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT draft_json, created FROM extraction_cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or (self.ttl is not None and time.time() - row[1] > self.ttl):
+            return None
+        self.l2_hits += 1
+        self._memory.set(key, row[0])
+        return row[0]
+
+    def put(self, normalized_text, draft_json: str):
+        key = self._key(normalized_text)
+        self._memory.set(key, draft_json)
+        if self._db is not None:
+            with self._db_lock, self._db:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO extraction_cache VALUES (?, ?, ?, ?)",
+                    (key, self.namespace, draft_json, time.time())
+                )
+
+    def stats(self):
+        stats = self._memory.stats()
+        stats["l2_hits"] = self.l2_hits
+        stats["l2_enabled"] = self._db is not None
+        stats["namespace"] = self.namespace
+        return stats
+
+
+def draft_to_json(draft) -> str:
+    return json.dumps(draft.model_dump(mode="json", exclude_none=True), ensure_ascii=False, sort_keys=True)
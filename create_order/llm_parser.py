@@ -1,8 +1,13 @@
+import os
 import json
 from datetime import date
 from pydantic import ValidationError
 from .schemas import Order, OrderDraft
 from .dialogue import extract_json, calc_missing, to_order_if_complete, to_strict_order
+from .rule_extractor import extract_order_rules
+from .llm_cache import ExtractionCache, normalize_request, prompt_namespace, draft_to_json
+from .bedrock_invoke import ModelCapabilities, BedrockInvoker, is_unsupported_parameter
+from .validation import construct_draft
 from langchain_aws import ChatBedrock
 import boto3
 from botocore.exceptions import BotoCoreError, ClientError
@@ -51,6 +56,18 @@ USER_TEMPLATE_JA = """\
 BEDROCK_REGION = "us-east-1"
 MODEL_ID = "anthropic.claude-3-sonnet-20240229-v1:0"
 
+# 规则抽取的置信度达到该值、且必填项齐全时不调用 LLM（见 rule_extractor.py）
+RULE_CONFIDENCE_THRESHOLD = 0.8
+
+# LLM 抽取结果缓存（SQLite 文件路径，None 为只用内存）
+LLM_CACHE_DB = os.path.join(os.path.dirname(__file__), "..", ".cache", "order_extraction.sqlite3")
+
+# 各模型是否支持 response_format 的探测结果（JSON 文件路径，None 为只记在进程内）
+MODEL_CAPABILITIES_PATH = os.path.join(os.path.dirname(__file__), "..", ".cache", "bedrock_capabilities.json")
+MODEL_CAPABILITIES_TTL = 24 * 3600  # response_format 支持情况的记录有效秒数，过期后重新探测
+BEDROCK_MAX_CONCURRENCY = 4   # 本进程同时调用 Bedrock 的上限
+BEDROCK_MAX_ATTEMPTS = 4      # 限流错误时的最多尝试次数（含第一次）
+
 # 懒加载客户端（模块级单例）
 _bedrock_rt = None
 def _bedrock_client():
@@ -59,12 +76,18 @@ def _bedrock_client():
         _bedrock_rt = boto3.client("bedrock-runtime", region_name=BEDROCK_REGION)
     return _bedrock_rt
 
-def call_llm(prompt: str) -> str:
+model_capabilities = ModelCapabilities(MODEL_CAPABILITIES_PATH, ttl=MODEL_CAPABILITIES_TTL)
+bedrock_invoker = BedrockInvoker(max_concurrency=BEDROCK_MAX_CONCURRENCY, max_attempts=BEDROCK_MAX_ATTEMPTS)
+
+def call_llm(prompt: str, client=None) -> str:
     """
     使用 Amazon Bedrock 的 Anthropic Messages API 调用 Claude。
     - 使用 SYSTEM_JA 作为 system 提示
     - 优先尝试 response_format={"type":"json_object"} 以强制 JSON 输出
-    - 若该模型/版本不支持，上游报错时自动回退为普通文本并由上层做 JSON 抽取
+    - 若该模型/版本不支持（错误信息点名 response_format 的 ValidationException），回退为普通文本并由上层做 JSON 抽取；
+      结果按 MODEL_ID 记入 model_capabilities（MODEL_CAPABILITIES_TTL 秒后重新探测），之后直接用能用的请求形式
+    - 限流错误按抖动退避重试，并发数受 bedrock_invoker 限制
+    - client：可注入 bedrock-runtime 客户端（离线测试时传入桩对象），默认用模块级单例
     返回：模型输出的字符串（预期为严格 JSON）
     """
     body_base = {
@@ -81,7 +104,7 @@ def call_llm(prompt: str) -> str:
     body_json = dict(body_base)
     body_json["response_format"] = {"type": "json_object"}
 
-    client = _bedrock_client()
+    client = client or _bedrock_client()
 
     def _invoke(request_body: dict) -> str:
         resp = client.invoke_model(
@@ -94,21 +117,54 @@ def call_llm(prompt: str) -> str:
         # Anthropic Messages API: 文本位于 content[0].text
         return payload["content"][0]["text"]
 
-    # 尝试 1：强制 JSON 输出
     try:
-        return _invoke(body_json)
-    except (ClientError, BotoCoreError, KeyError, IndexError, TypeError, json.JSONDecodeError):
-        # 尝试 2：去掉 response_format 的保守回退
-        try:
-            return _invoke(body_base)
-        except Exception as e:
-            # 统一抛出让上层处理（上层已有 {...} 截取与 Pydantic 校验兜底）
-            raise RuntimeError(f"Bedrock invoke failed: {e}")
-
-def parse_order_from_text(request_text: str) -> Order:
-    raw = call_llm(USER_TEMPLATE_JA.format(request=request_text))
+        supports_json = model_capabilities.supports_response_format(MODEL_ID)
+        if supports_json is not False:
+            # 尝试 1：强制 JSON 输出（未探测过或已知支持）
+            try:
+                text = bedrock_invoker.call(_invoke, body_json)
+                model_capabilities.record(MODEL_ID, True)
+                return text
+            except ClientError as e:
+                # 只有错误信息点名 response_format 时才记为不支持；其它 ValidationException 照常抛出
+                if not is_unsupported_parameter(e, "response_format"):
+                    raise
+                model_capabilities.record(MODEL_ID, False)
+            except (KeyError, IndexError, TypeError, json.JSONDecodeError):
+                pass  # 这一次的响应形状不对：本次退回普通文本，不影响对模型能力的判断
+
+        # 尝试 2：去掉 response_format
+        return bedrock_invoker.call(_invoke, body_base)
+    except Exception as e:
+        # 统一抛出让上层处理（上层已有 {...} 截取与 Pydantic 校验兜底）
+        raise RuntimeError(f"Bedrock invoke failed: {e}")
+
+# 模型 ID 或提示词变化时 namespace 随之变化，旧结果不会再命中
+extraction_cache = ExtractionCache(
+    prompt_namespace(MODEL_ID, SYSTEM_JA, USER_TEMPLATE_JA),
+    sqlite_path=LLM_CACHE_DB,
+)
+
+def parse_order_from_text(request_text: str, client=None, cache: ExtractionCache = None) -> Order:
+    """
+    client / cache 可注入（离线测试用桩客户端 + 临时缓存），默认为 Bedrock 客户端与模块级缓存。
+    """
+    cache = cache or extraction_cache
+
+    # 先走规则抽取：简单的依赖（单品目 + 数量 + 单价 + 发注者）不必等 Bedrock
+    draft, confidence = extract_order_rules(request_text)
+    if confidence >= RULE_CONFIDENCE_THRESHOLD and not calc_missing(draft):
+        return draft
+
+    text = normalize_request(request_text)
+    cached = cache.get(text)
+    if cached is not None:
+        return construct_draft(json.loads(cached))  # 自己写入的、已校验过的结果
+
+    raw = call_llm(USER_TEMPLATE_JA.format(request=text), client=client)
     data = extract_json(raw)
 
     draft = OrderDraft(**data)  # ← 允许很多字段为 None
+    cache.put(text, draft_to_json(draft))
 
     return draft
\ No newline at end of file
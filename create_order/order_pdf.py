@@ -1,17 +1,32 @@
+import os
+import re
+import json
+import asyncio
 from fastapi import APIRouter, HTTPException, Request
-from fastapi.responses import StreamingResponse
-from jinja2 import Environment, FileSystemLoader, select_autoescape
-from weasyprint import HTML, CSS
+from fastapi.responses import StreamingResponse, Response
+from pydantic import ValidationError
 from io import BytesIO
 from datetime import date
 from decimal import Decimal, ROUND_HALF_UP, getcontext
-import os
 from urllib.parse import quote
 from .schemas import Order
+from .render_context import TemplateCache, TEMPLATES_DIR, STATIC_DIR
+from .pdf_renderer import PdfRenderPool, PdfRenderBusy, PdfRenderTimeout, PdfRenderFailed
+from .pdf_cache import PdfDiskCache, order_cache_key
+from .validation import validate_order_json, construct_order, verify_order, ORDER_LIST_ADAPTER
+from .bulk_pdf import render_in_order, stream_zip, merge_pdfs
 
 # 选择你的 PDF 引擎：
 USE_WEASYPRINT = True  # 如果想换 xhtml2pdf，把这个设为 False 并看下方注释
 
+PDF_RENDER_WORKERS = 2      # PDF 渲染进程数
+PDF_RENDER_MAX_PENDING = 8  # 排队上限，超出返回 503
+PDF_RENDER_TIMEOUT = 30     # 单个 PDF 渲染超时（秒），超时返回 504
+BULK_PDF_MAX_ORDERS = 5000  # 一次批量请求的注文数上限（ZIP）
+BULK_PDF_MAX_MERGED = 500   # 合并为一个 PDF 时的上限（需要在内存中拼装）
+PDF_CACHE_DIR = os.path.join(os.path.dirname(__file__), "..", ".cache", "order_pdf")  # 渲染结果缓存目录
+PDF_CACHE_MAX_BYTES = 256 * 1024 * 1024  # 缓存总大小上限，超出按 LRU 淘汰
+
 
 router = APIRouter()
 
@@ -50,16 +65,20 @@ def get_order_data(order: Order):
         }
     }
 
-# Jinja2 環境
-TEMPLATES_DIR = os.path.join(os.path.dirname(__file__), "..", "templates")
-STATIC_DIR     = os.path.join(os.path.dirname(__file__), "..", "static")
+# Jinja2 模板缓存（按 template_id 保持编译结果，模板文件更新时自动重新加载）
+template_cache = TemplateCache()
+
+getcontext().prec = 28  # 充足精度
 
-jinja_env = Environment(
-    loader=FileSystemLoader(TEMPLATES_DIR),
-    autoescape=select_autoescape(["html", "xml"])
+# WeasyPrint 渲染放到独立进程池，不阻塞事件循环
+pdf_render_pool = PdfRenderPool(
+    max_workers=PDF_RENDER_WORKERS,
+    max_pending=PDF_RENDER_MAX_PENDING,
+    timeout=PDF_RENDER_TIMEOUT,
 )
 
-getcontext().prec = 28  # 充足精度
+# 相同注文 + 相同模板版本的 PDF 直接复用，不再渲染
+pdf_cache = PdfDiskCache(PDF_CACHE_DIR, max_bytes=PDF_CACHE_MAX_BYTES)
 
 def to_decimal(x) -> Decimal:
     # 任何输入都转成 Decimal，避免 float 误差
@@ -72,14 +91,7 @@ def money_round(x: Decimal) -> Decimal:
     # 按四舍五入到最小货币单位（JPY 可用到整数；若是小数货币，可用 '0.01'）
     return x.quantize(Decimal("1"), rounding=ROUND_HALF_UP)
 
-@router.post("/orders/pdf")
-async def create_order_pdf(request: Request):
-
-    order_info = await request.json()
-    order = Order(**order_info)
-    print(order)
-
-    order_id = "12345"
+def render_order_html(order: Order) -> str:
     data = get_order_data(order)
     if not data:
         raise HTTPException(status_code=404, detail="Order not found")
@@ -95,29 +107,161 @@ async def create_order_pdf(request: Request):
     data["tax"] = tax
     data["total"] = total
 
-    template = jinja_env.get_template("order_pdf.html")
-    html_str = template.render(data=data)
+    template = template_cache.get(order.template_id)
+    return template.render(data=data)
 
-    # base_url 指定で相対パスの静的ファイル（字体/CSS/图片）を解決
-    base_url = STATIC_DIR  # 让模板里 /static/... 能被找到。也可以用项目根目录
-    html = HTML(string=html_str, base_url=base_url)
+def etag_matches(if_none_match, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # 可能是逗号分隔的多个 ETag；弱比较，忽略 W/ 前缀
+    candidates = (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+    return etag in candidates
 
-    # 可选：外部 CSS
-    css = CSS(string="""
-      @page { size: A4; margin: 18mm 14mm; }
-    """)
+@router.post("/orders/pdf")
+async def create_order_pdf(request: Request):
 
-    pdf_io = BytesIO()
-    html.write_pdf(pdf_io, stylesheets=[css])
-    pdf_io.seek(0)
+    body = await request.body()
+    order_token = request.headers.get("x-order-token")
+    order_info = None
+    if order_token:
+        try:
+            order_info = json.loads(body)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            order_info = None  # 令牌无效，交给下面的正常校验报错
+    if isinstance(order_info, dict) and verify_order(order_info, order_token):
+        # 对话结束时服务器签发的 order，原样提交回来：已校验过，直接构造
+        order = construct_order(order_info)
+    else:
+        try:
+            order = validate_order_json(body)
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail=f"order: {e}")
 
+    order_id = "12345"
     order_id = str(order_id)  # 确保是字符串
     ascii_name = f"order_{order_id}.pdf"
     utf8_name = quote(f"注文書_{order_id}.pdf")  # URL 编码, 全 ASCII
 
+    # ETag = 注文内容 + 模板版本的哈希，内容不变则 PDF 不变
+    cache_key = order_cache_key(order)
+    etag = f'"{cache_key}"'
     headers = {
         # RFC 5987: ASCII 回退 + UTF-8 真正文件名
-        "Content-Disposition": f"attachment; filename=\"{ascii_name}\"; filename*=UTF-8''{utf8_name}"
+        "Content-Disposition": f"attachment; filename=\"{ascii_name}\"; filename*=UTF-8''{utf8_name}",
+        "ETag": etag,
+        "Cache-Control": "private, no-cache",
     }
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    pdf_bytes = await asyncio.to_thread(pdf_cache.get, cache_key)
+    if pdf_bytes is None:
+        html_str = render_order_html(order)
+
+        # base_url 指定で相対パスの静的ファイル（字体/CSS/图片）を解決
+        base_url = STATIC_DIR  # 让模板里 /static/... 能被找到。也可以用项目根目录
+
+        try:
+            pdf_bytes = await pdf_render_pool.render(html_str, base_url, order.template_id)
+        except PdfRenderBusy:
+            raise HTTPException(status_code=503, detail="PDF生成が混み合っています。しばらくしてから再度お試しください。",
+                                headers={"Retry-After": "5"})
+        except PdfRenderTimeout:
+            raise HTTPException(status_code=504, detail="PDF生成がタイムアウトしました。")
+        except PdfRenderFailed:
+            raise HTTPException(status_code=503, detail="PDF生成に失敗しました。しばらくしてから再度お試しください。",
+                                headers={"Retry-After": "5"})
+        await asyncio.to_thread(pdf_cache.put, cache_key, pdf_bytes)
+
+    return Response(content=pdf_bytes, media_type="application/pdf", headers=headers)
+
+@router.get("/orders/pdf/cache_stats")
+async def order_pdf_cache_stats():
+    return pdf_cache.stats()
+
+_UNSAFE_NAME_CHARS = re.compile(r"[^A-Za-z0-9_-]+")
+
+def safe_name_part(value, default="noid", max_len=64) -> str:
+    # 客户端传来的值放进文件名 / ZIP 条目名前只留 [A-Za-z0-9_-]，防止 "../" 之类的路径穿越（zip-slip）
+    cleaned = _UNSAFE_NAME_CHARS.sub("_", str(value or "")).strip("_")[:max_len]
+    return cleaned or default
+
+def attachment_headers(ascii_name: str, utf8_name: str) -> dict:
+    # RFC 5987: ASCII 回退 + UTF-8 真正文件名
+    return {"Content-Disposition": f"attachment; filename=\"{ascii_name}\"; filename*=UTF-8''{quote(utf8_name)}"}
+
+
+async def read_bulk_orders(request: Request) -> list:
+    """
+    批量注文的三种输入：
+    - JSON：注文数组，或 {"orders": [...]}
+    - JSONL 正文（Content-Type: application/x-ndjson / application/jsonl），一行一个注文
+    - multipart 上传的 JSONL 文件（字段名 file）
+    """
+    content_type = request.headers.get("content-type", "")
+    try:
+        if content_type.startswith("multipart/form-data"):
+            form = await request.form()
+            upload = form.get("file")
+            if upload is None or isinstance(upload, str):
+                raise HTTPException(status_code=400, detail="JSONLファイルを file フィールドで送信してください。")
+            text = (await upload.read()).decode("utf-8-sig")
+            raw_orders = [json.loads(line) for line in text.splitlines() if line.strip()]
+        elif "ndjson" in content_type or "jsonl" in content_type:
+            text = (await request.body()).decode("utf-8-sig")
+            raw_orders = [json.loads(line) for line in text.splitlines() if line.strip()]
+        else:
+            payload = await request.json()
+            raw_orders = payload.get("orders") if isinstance(payload, dict) else payload
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=f"注文データを読み取れません: {e}")
+
+    if not isinstance(raw_orders, list) or not raw_orders:
+        raise HTTPException(status_code=400, detail="注文が1件以上必要です。")
+    if len(raw_orders) > BULK_PDF_MAX_ORDERS:
+        raise HTTPException(status_code=413, detail=f"一度に処理できる注文は {BULK_PDF_MAX_ORDERS} 件までです。")
+
+    # 渲染开始后就无法再返回错误状态码，所以先全部校验（一次调用校验整个列表，错误位置里带下标）
+    try:
+        return ORDER_LIST_ADAPTER.validate_python(raw_orders)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=f"orders: {e}")
+
+
+@router.post("/orders/pdf/bulk")
+async def create_order_pdf_bulk(request: Request, format: str = "zip"):
+    """
+    多个注文一次生成 PDF。
+    format=zip（默认）：每个注文一个 PDF，渲染完一个就写进 ZIP 流式返回（渲染失败的注文写成 .ERROR.txt）
+    format=pdf：合并为一个 PDF（全部渲染完成后返回）
+    """
+    if format not in ("zip", "pdf"):
+        raise HTTPException(status_code=400, detail="format は zip または pdf を指定してください。")
+    orders = await read_bulk_orders(request)
+    if format == "pdf" and len(orders) > BULK_PDF_MAX_MERGED:
+        raise HTTPException(status_code=413, detail=f"PDF結合は {BULK_PDF_MAX_MERGED} 件までです。ZIPをご利用ください。")
+
+    jobs = (
+        (f"order_{i + 1:05d}_{safe_name_part(order.order_id)}.pdf", lambda order=order: render_order_html(order), order.template_id)
+        for i, order in enumerate(orders)
+    )
+    # 同时在渲染的任务数 = worker 数，其余注文保持未渲染状态，内存只随 worker 数增长
+    named_pdfs = render_in_order(jobs, pdf_render_pool, STATIC_DIR, window=PDF_RENDER_WORKERS)
+
+    if format == "pdf":
+        try:
+            pdf_bytes = await merge_pdfs(named_pdfs)
+        except PdfRenderTimeout:
+            raise HTTPException(status_code=504, detail="PDF生成がタイムアウトしました。")
+        except PdfRenderFailed:
+            raise HTTPException(status_code=503, detail="PDF生成に失敗しました。しばらくしてから再度お試しください。",
+                                headers={"Retry-After": "5"})
+        except ImportError:
+            raise HTTPException(status_code=501, detail="PDF結合には pypdf が必要です。")
+        return StreamingResponse(BytesIO(pdf_bytes), media_type="application/pdf",
+                                 headers=attachment_headers("orders.pdf", "注文書_一括.pdf"))
 
-    return StreamingResponse(pdf_io, media_type="application/pdf", headers=headers)
+    return StreamingResponse(stream_zip(named_pdfs), media_type="application/zip",
+                             headers=attachment_headers("orders.zip", "注文書_一括.zip"))
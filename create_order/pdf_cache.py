@@ -0,0 +1,116 @@
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from .render_context import resolve_template_id, template_version
+
+
+def order_cache_key(order) -> str:
+    """校验后的 Order + 模板版本 → sha256。内容相同的注文（字段顺序、别名写法不同也一样）得到同一个 key"""
+    payload = {
+        "order": order.model_dump(mode="json"),
+        "template": resolve_template_id(order.template_id),
+        "template_version": template_version(order.template_id),
+    }
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class PdfDiskCache:
+    """
+    渲染好的 PDF 的本地磁盘缓存（内容寻址，key → <dir>/<key[:2]>/<key>.pdf）。
+    总大小超过 max_bytes 时淘汰最久未使用的文件；访问顺序用文件 mtime 记录，重启后按 mtime 恢复。
+    线程安全（读写在线程池里执行）。
+    """
+
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._sizes = OrderedDict()  # key -> 字节数，按最近使用排序
+        self._total = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        self._scan()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".pdf")
+
+    def _scan(self):
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(".pdf"):
+                    continue
+                st = os.stat(os.path.join(root, name))
+                entries.append((st.st_mtime_ns, name[:-4], st.st_size))
+        for _, key, size in sorted(entries):
+            self._sizes[key] = size
+            self._total += size
+        self._evict()
+
+    def _evict(self):
+        while self._total > self.max_bytes and self._sizes:
+            key, size = self._sizes.popitem(last=False)
+            self._total -= size
+            self.evictions += 1
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._sizes:
+                self.misses += 1
+                return None
+            path = self._path(key)
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+                os.utime(path)
+            except FileNotFoundError:
+                # 被外部删掉了
+                self._total -= self._sizes.pop(key)
+                self.misses += 1
+                return None
+            self._sizes.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写临时文件再 rename，读到的永远是完整文件
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        with self._lock:
+            self._total -= self._sizes.pop(key, 0)
+            self._sizes[key] = len(data)
+            self._total += len(data)
+            self._evict()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._sizes),
+                "bytes": self._total,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
@@ -0,0 +1,106 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from .render_context import StyleCache, DEFAULT_TEMPLATE_ID
+
+# worker 进程内的 CSS / 字体缓存（每个进程一份）
+_style_cache = None
+
+
+class PdfRenderBusy(Exception):
+    """渲染队列已满（所有 worker 忙且等待数达到上限）"""
+
+
+class PdfRenderTimeout(Exception):
+    """单个渲染任务超时"""
+
+
+class PdfRenderFailed(Exception):
+    """worker 进程异常退出（换新进程池重试后仍失败）"""
+
+
+def _get_style_cache():
+    global _style_cache
+    if _style_cache is None:
+        _style_cache = StyleCache()
+    return _style_cache
+
+
+def _warm_up():
+    # worker 进程启动时先导入 WeasyPrint 并解析默认模板的样式，首个任务不用再付这些成本
+    _get_style_cache().get(DEFAULT_TEMPLATE_ID)
+
+
+def render_pdf(html_str: str, base_url: str, template_id: str = DEFAULT_TEMPLATE_ID) -> bytes:
+    """在 worker 进程中执行：HTML 字符串 → PDF 字节（样式表和字体配置按 template_id 复用）"""
+    from weasyprint import HTML
+    font_config, stylesheets = _get_style_cache().get(template_id)
+    html = HTML(string=html_str, base_url=base_url)
+    return html.write_pdf(stylesheets=stylesheets, font_config=font_config)
+
+
+class PdfRenderPool:
+    """
+    WeasyPrint 渲染专用进程池（CPU 密集、持有 GIL，放在线程里也会拖慢事件循环）。
+    - max_workers：worker 进程数
+    - max_pending：排队中的任务上限，正在渲染 + 排队已满时立即抛 PdfRenderBusy（上层返回 503）
+    - timeout：单个任务从开始渲染起的超时秒数（排队时间不计）；超时后回收整个进程池（卡住的 worker 无法单独取消）
+    同时提交给进程池的任务不超过 max_workers 个，其余在池外排队，所以提交后的任务会立即开始渲染。
+    进程池被回收（或 worker 崩溃）时，受牵连的其他任务换新进程池重试一次，仍失败则抛 PdfRenderFailed（上层返回 503）。
+    只在事件循环线程中使用。
+    """
+
+    def __init__(self, max_workers=2, max_pending=8, timeout=30):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._executor = None
+        self._inflight = 0
+        self._running = asyncio.Semaphore(max_workers)
+
+    def _get_executor(self):
+        if self._executor is None:
+            # spawn：不 fork 已经加载了模型和线程池的主进程
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_warm_up,
+            )
+        return self._executor
+
+    def _recycle(self, executor):
+        # 只回收出问题的那个进程池；已经换上的新进程池不动
+        if executor is self._executor:
+            self._executor = None
+        for process in list((executor._processes or {}).values()):
+            process.terminate()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    async def render(self, html_str: str, base_url: str, template_id: str = DEFAULT_TEMPLATE_ID) -> bytes:
+        if self._inflight >= self.max_workers + self.max_pending:
+            raise PdfRenderBusy()
+
+        self._inflight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            async with self._running:
+                for attempt in range(2):
+                    executor = self._get_executor()
+                    future = loop.run_in_executor(executor, render_pdf, html_str, base_url, template_id)
+                    try:
+                        return await asyncio.wait_for(future, self.timeout)
+                    except asyncio.TimeoutError:
+                        self._recycle(executor)
+                        raise PdfRenderTimeout()
+                    except BrokenProcessPool:
+                        # 别的任务超时回收了进程池，或 worker 进程崩溃
+                        self._recycle(executor)
+                raise PdfRenderFailed()
+        finally:
+            self._inflight -= 1
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,107 @@
+import os
+import time
+import threading
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(__file__), "..", "templates")
+STATIC_DIR = os.path.join(os.path.dirname(__file__), "..", "static")
+
+# template_id → (HTML 模板, 样式表)。Order.template_id 不在表中时使用默认模板
+TEMPLATE_FILES = {
+    "invoice_default_v1": ("order_pdf.html", "order_pdf.css"),
+}
+DEFAULT_TEMPLATE_ID = "invoice_default_v1"
+
+# 页面设置（A4 + 页边距）
+PAGE_CSS = """
+  @page { size: A4; margin: 18mm 14mm; }
+"""
+
+
+def resolve_template_id(template_id):
+    return template_id if template_id in TEMPLATE_FILES else DEFAULT_TEMPLATE_ID
+
+
+def template_version(template_id):
+    """模板文件的修改时间，模板改动后随之变化（可用作缓存 key 的一部分）"""
+    html_name, css_name = TEMPLATE_FILES[resolve_template_id(template_id)]
+    return "-".join(str(os.stat(os.path.join(TEMPLATES_DIR, name)).st_mtime_ns) for name in (html_name, css_name))
+
+
+class _ReloadingCache:
+    """
+    template_id → 构建好的对象。文件修改时间变化时重新构建（热加载）；
+    mtime 最多每 check_interval 秒检查一次，避免每个请求都 stat。
+    """
+
+    def __init__(self, build, files_of, check_interval=2.0):
+        self._build = build
+        self._files_of = files_of
+        self.check_interval = check_interval
+        self._entries = {}  # template_id -> (mtimes, value, checked_at)
+        self._lock = threading.Lock()
+
+    def _mtimes(self, template_id):
+        return tuple(os.stat(path).st_mtime_ns for path in self._files_of(template_id))
+
+    def get(self, template_id):
+        template_id = resolve_template_id(template_id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(template_id)
+            if entry is not None and now - entry[2] < self.check_interval:
+                return entry[1]
+            mtimes = self._mtimes(template_id)
+            if entry is not None and entry[0] == mtimes:
+                self._entries[template_id] = (mtimes, entry[1], now)
+                return entry[1]
+            value = self._build(template_id)
+            self._entries[template_id] = (mtimes, value, now)
+            return value
+
+
+class TemplateCache(_ReloadingCache):
+    """编译好的 Jinja 模板（主进程使用）"""
+
+    def __init__(self, check_interval=2.0):
+        # 自己按 mtime 热加载，关掉 Jinja 每次 get_template 的 uptodate 检查
+        self.env = Environment(
+            loader=FileSystemLoader(TEMPLATES_DIR),
+            autoescape=select_autoescape(["html", "xml"]),
+            auto_reload=False,
+        )
+        super().__init__(self._compile, self._html_file, check_interval)
+
+    @staticmethod
+    def _html_file(template_id):
+        return [os.path.join(TEMPLATES_DIR, TEMPLATE_FILES[template_id][0])]
+
+    def _compile(self, template_id):
+        if self.env.cache is not None:
+            self.env.cache.clear()  # 丢掉旧的编译结果
+        return self.env.get_template(TEMPLATE_FILES[template_id][0])
+
+
+class StyleCache(_ReloadingCache):
+    """解析好的 WeasyPrint CSS 与字体配置（渲染 worker 进程使用）"""
+
+    def __init__(self, check_interval=2.0):
+        super().__init__(self._parse, self._css_file, check_interval)
+
+    @staticmethod
+    def _css_file(template_id):
+        return [os.path.join(TEMPLATES_DIR, TEMPLATE_FILES[template_id][1])]
+
+    @staticmethod
+    def _parse(template_id):
+        from weasyprint import CSS
+        from weasyprint.text.fonts import FontConfiguration
+
+        # FontConfiguration 持有 @font-face 加载的字体，随 CSS 一起复用；字体 URL 相对 STATIC_DIR 解析
+        font_config = FontConfiguration()
+        stylesheets = [
+            CSS(filename=os.path.join(TEMPLATES_DIR, TEMPLATE_FILES[template_id][1]),
+                base_url=STATIC_DIR, font_config=font_config),
+            CSS(string=PAGE_CSS, font_config=font_config),
+        ]
+        return font_config, stylesheets
@@ -0,0 +1,145 @@
+"""
+注文依頼の規則ベース抽出（LLM の前段）。
+「ABC-123のボールペンを5個、単価120円で山田さんへ」のような単純な依頼は
+正規表現だけで OrderDraft を作り、Bedrock を呼ばない。
+抽出結果と一緒に confidence（0〜1）を返し、低い場合は呼び出し側が LLM にフォールバックする。
+"""
+import re
+import unicodedata
+from decimal import Decimal, InvalidOperation
+from typing import Optional, Tuple
+from .schemas import OrderDraft, PartyDraft, OrderItemDraft
+
+# 全角→半角は NFKC で済ませるので、パターンは半角だけ書けばよい
+_SKU = r"[A-Z]{1,6}-?[A-Z]{0,2}\d{2,8}(?:-[A-Z0-9]{1,6})?"
+SKU_RE = re.compile(rf"(?<![A-Za-z0-9-])(?:型番|品番|SKU)?\s*[:：]?\s*({_SKU})(?![A-Za-z0-9])")
+
+COUNTERS = "個|台|本|枚|箱|冊|点|袋|缶|脚|着|セット|ケース|つ|pcs"
+QTY_RE = re.compile(rf"(?:数量\s*[:：]?\s*(\d+)\s*(?:{COUNTERS})?|(\d+)\s*(?:{COUNTERS}))(?!\s*(?:あたり|当たり|につき))")
+
+_AMOUNT = r"(\d{1,3}(?:,\d{3})+|\d+)(?:\.(\d{1,2}))?"
+PRICE_RE = re.compile(
+    rf"(?:単価\s*[:：]?\s*[¥￥]?\s*{_AMOUNT}\s*円?"
+    rf"|[¥￥]\s*{_AMOUNT}"
+    rf"|{_AMOUNT}\s*円"
+    rf"|@\s*{_AMOUNT})"
+)
+
+# 名前に使う文字（ひらがなは助詞と区別できないので含めない）
+_NAME_CHARS = r"[一-龥ァ-ヶー々・&A-Za-z0-9]"
+_HONORIFIC = r"(?:さん|様|さま|殿|御中)"
+HONORIFIC_RE = re.compile(rf"({_NAME_CHARS}{{1,20}})\s*{_HONORIFIC}")
+COMPANY_RE = re.compile(rf"((?:株式会社|有限会社|合同会社)\s*{_NAME_CHARS}{{1,20}}|{_NAME_CHARS}{{1,20}}(?:株式会社|有限会社|合同会社))")
+BUYER_LABEL_RE = re.compile(r"(?:発注者|購入者|買い手|請求先|宛先|お客様名?)\s*[:：は]\s*([^\s、,。]{1,20}?)(?:さん|様|です|$|[\s、,。])")
+
+NAME_AFTER_SKU_RE = re.compile(rf"{_SKU}\s*(?:の|[:：]|\s)\s*([^\s、,。を\d()（）:：]{{1,30}}?)\s*(?:を|が|、|,|\s|\d|$)")
+NAME_BEFORE_SKU_RE = re.compile(rf"([^\s、,。を\d()（）:：]{{1,30}}?)\s*[(（]\s*(?:型番|品番|SKU)?\s*[:：]?\s*{_SKU}\s*[)）]")
+NAME_LABEL_RE = re.compile(r"(?:品名|商品名|品目名?)\s*[:：は]\s*([^\s、,。]{1,30})")
+
+# LLM なら拾える他の項目の手がかり。出てきたら規則抽出は諦める（情報を落とさないため）
+# 日付（3月15日・2025-03-15・3/15・15日まで）や急ぎ・配送の指示も含む
+EXTRA_INFO_RE = re.compile(
+    r"送料|値引|割引|支払|振込|カード|現金|期日|納期|発行日|メール|@\S+\.|住所|電話|税率|備考|"
+    r"ドル|ユーロ|USD|EUR|\d{1,2}月\d{1,2}日|\d{4}[-/]\d{1,2}[-/]\d{1,2}|(?<![\d/])\d{1,2}/\d{1,2}(?![\d/])|"
+    r"\d{1,2}日(?:まで|中|着)|までに|本日|今日|明日|明後日|今週|来週|月末|"
+    r"至急|急ぎ|早急|急いで|大急ぎ|配送|配達|納品|お届け|希望|"
+    r"合計|それぞれ|および|及び|と\d"
+)
+
+# 人名として拾ってはいけない語
+_NOT_A_NAME = {"お客", "皆", "皆さん", "担当", "御社", "弊社"}
+
+FIELDS = ("buyer.name", "items[0].sku", "items[0].name", "items[0].qty", "items[0].unit_price")
+
+
+def normalize(text: str) -> str:
+    return unicodedata.normalize("NFKC", text or "").strip()
+
+
+def strip_honorific(name: str) -> str:
+    return re.sub(rf"\s*{_HONORIFIC}$", "", name.strip())
+
+
+def _unique(values):
+    seen = []
+    for v in values:
+        if v and v not in seen:
+            seen.append(v)
+    return seen
+
+
+def _price(integer: str, fraction: Optional[str]) -> Optional[Decimal]:
+    try:
+        value = Decimal(integer.replace(",", "") + ("." + fraction if fraction else ""))
+    except InvalidOperation:
+        return None
+    return value if value > 0 else None
+
+
+def _find_prices(text):
+    prices = []
+    for m in PRICE_RE.finditer(text):
+        groups = m.groups()
+        for i in range(0, len(groups), 2):
+            if groups[i]:
+                prices.append(_price(groups[i], groups[i + 1]))
+                break
+    return _unique(prices)
+
+
+def _find_quantities(text):
+    return _unique(int(a or b) for a, b in QTY_RE.findall(text) if int(a or b) > 0)
+
+
+def _find_buyers(text):
+    names = BUYER_LABEL_RE.findall(text) + HONORIFIC_RE.findall(text) + COMPANY_RE.findall(text)
+    names = (strip_honorific(n) for n in names)
+    return _unique(n for n in names if n and n not in _NOT_A_NAME)
+
+
+def _find_names(text):
+    names = NAME_LABEL_RE.findall(text) + NAME_AFTER_SKU_RE.findall(text) + NAME_BEFORE_SKU_RE.findall(text)
+    return _unique(n.strip() for n in names if n.strip() not in ("の", "を"))
+
+
+def extract_order_rules(request_text: str) -> Tuple[OrderDraft, float]:
+    """
+    規則ベースで OrderDraft を作る。
+    返り値: (draft, confidence)
+      - 各必須項目が「ちょうど1つ」見つかるほど confidence が上がる
+      - 候補が複数ある項目（複数明細・複数価格など）や、規則では扱わない情報があると大きく下げる
+    """
+    text = normalize(request_text)
+
+    skus = _unique(SKU_RE.findall(text))
+    quantities = _find_quantities(text)
+    prices = _find_prices(text)
+    buyers = _find_buyers(text)
+    names = _find_names(text)
+
+    found = {
+        "buyer.name": buyers,
+        "items[0].sku": skus,
+        "items[0].name": names,
+        "items[0].qty": quantities,
+        "items[0].unit_price": prices,
+    }
+
+    item = OrderItemDraft(
+        sku=skus[0] if skus else None,
+        name=names[0] if names else None,
+        qty=quantities[0] if quantities else None,
+        unit_price=prices[0] if prices else None,
+    )
+    draft = OrderDraft(
+        buyer=PartyDraft(name=buyers[0]) if buyers else None,
+        items=[item],
+    )
+    draft.missing_fields = [f for f in FIELDS if not found[f]] or None
+
+    score = sum(1 for f in FIELDS if len(found[f]) == 1) / len(FIELDS)
+    if any(len(v) > 1 for v in found.values()):
+        score *= 0.5
+    if EXTRA_INFO_RE.search(text):
+        score *= 0.5
+    return draft, round(score, 2)
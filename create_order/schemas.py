@@ -15,77 +15,77 @@ class PaymentMethod(str, Enum):
     CASH = "CASH"
 
 class OrderItemDraft(BaseModel):
-    sku: Optional[str] = Field(default=None, alias=AliasChoices("sku","SKU","型番"))
-    name: Optional[str] = Field(default=None, alias=AliasChoices("name","品名","商品名"))
-    qty: Optional[int]  = Field(default=None, gt=0, alias=AliasChoices("qty","数量"))
-    unit_price: Optional[condecimal(gt=0, max_digits=12, decimal_places=2)] = Field(default=None, alias=AliasChoices("unit_price","単価"))
-    discount: Optional[condecimal(ge=0, max_digits=12, decimal_places=2)] = Field(default=None, alias=AliasChoices("discount","値引"))
+    sku: Optional[str] = Field(default=None, validation_alias=AliasChoices("sku","SKU","型番"))
+    name: Optional[str] = Field(default=None, validation_alias=AliasChoices("name","品名","商品名"))
+    qty: Optional[int]  = Field(default=None, gt=0, validation_alias=AliasChoices("qty","数量"))
+    unit_price: Optional[condecimal(gt=0, max_digits=12, decimal_places=2)] = Field(default=None, validation_alias=AliasChoices("unit_price","単価"))
+    discount: Optional[condecimal(ge=0, max_digits=12, decimal_places=2)] = Field(default=None, validation_alias=AliasChoices("discount","値引"))
 
 class PartyDraft(BaseModel):
-    name: Optional[str] = Field(default=None, alias=AliasChoices("name","会社名","名称"))
-    email: Optional[EmailStr] = Field(default=None, alias=AliasChoices("email","メール"))
-    phone: Optional[str] = Field(default=None, alias=AliasChoices("phone","電話"))
-    address: Optional[str] = Field(default=None, alias=AliasChoices("address","住所"))
-    tax_id: Optional[str] = Field(default=None, alias=AliasChoices("tax_id","税番号","法人番号"))
+    name: Optional[str] = Field(default=None, validation_alias=AliasChoices("name","会社名","名称"))
+    email: Optional[EmailStr] = Field(default=None, validation_alias=AliasChoices("email","メール"))
+    phone: Optional[str] = Field(default=None, validation_alias=AliasChoices("phone","電話"))
+    address: Optional[str] = Field(default=None, validation_alias=AliasChoices("address","住所"))
+    tax_id: Optional[str] = Field(default=None, validation_alias=AliasChoices("tax_id","税番号","法人番号"))
 
 class OrderDraft(BaseModel):
-    template_id: Optional[str] = Field(default="invoice_default_v1", alias=AliasChoices("template_id","テンプレート"))
-    issue_date: Optional[date] = Field(default=None, alias=AliasChoices("issue_date","発行日"))
-    due_date: Optional[date] = Field(default=None, alias=AliasChoices("due_date","支払期日"))
-    seller: Optional[PartyDraft] = Field(default=None, alias=AliasChoices("seller","売り手","発行者"))
-    buyer: Optional[PartyDraft]  = Field(default=None, alias=AliasChoices("buyer","買い手","請求先"))
-    currency: Optional[Currency] = Field(default=None, alias=AliasChoices("currency","通貨"))
-    payment_method: Optional[PaymentMethod] = Field(default=None, alias=AliasChoices("payment_method","支払方法"))
-    items: Optional[List[OrderItemDraft]] = Field(default=None, alias=AliasChoices("items","明細"))
-    tax_rate_pct: Optional[condecimal(ge=0, le=100, max_digits=5, decimal_places=2)] = Field(default=None, alias=AliasChoices("tax_rate_pct","消費税率"))
-    shipping_fee: Optional[condecimal(ge=0, max_digits=12, decimal_places=2)] = Field(default=None, alias=AliasChoices("shipping_fee","送料"))
-    notes: Optional[str] = Field(default=None, alias=AliasChoices("notes","備考"))
+    template_id: Optional[str] = Field(default="invoice_default_v1", validation_alias=AliasChoices("template_id","テンプレート"))
+    issue_date: Optional[date] = Field(default=None, validation_alias=AliasChoices("issue_date","発行日"))
+    due_date: Optional[date] = Field(default=None, validation_alias=AliasChoices("due_date","支払期日"))
+    seller: Optional[PartyDraft] = Field(default=None, validation_alias=AliasChoices("seller","売り手","発行者"))
+    buyer: Optional[PartyDraft]  = Field(default=None, validation_alias=AliasChoices("buyer","買い手","請求先"))
+    currency: Optional[Currency] = Field(default=None, validation_alias=AliasChoices("currency","通貨"))
+    payment_method: Optional[PaymentMethod] = Field(default=None, validation_alias=AliasChoices("payment_method","支払方法"))
+    items: Optional[List[OrderItemDraft]] = Field(default=None, validation_alias=AliasChoices("items","明細"))
+    tax_rate_pct: Optional[condecimal(ge=0, le=100, max_digits=5, decimal_places=2)] = Field(default=None, validation_alias=AliasChoices("tax_rate_pct","消費税率"))
+    shipping_fee: Optional[condecimal(ge=0, max_digits=12, decimal_places=2)] = Field(default=None, validation_alias=AliasChoices("shipping_fee","送料"))
+    notes: Optional[str] = Field(default=None, validation_alias=AliasChoices("notes","備考"))
     missing_fields: Optional[List[str]] = Field(default=None, alias="missing_fields")
 
 class Party(BaseModel):
     model_config = ConfigDict(populate_by_name=True)
 
     # 英語キー（第一候補） + 日本語エイリアス
-    name: str = Field(alias=AliasChoices("name", "名称", "会社名", "氏名"))
-    email: Optional[EmailStr] = Field(default=None, alias=AliasChoices("email", "メール", "メールアドレス"))
-    phone: Optional[str]      = Field(default=None, alias=AliasChoices("phone", "電話", "電話番号"))
-    address: Optional[str]    = Field(default=None, alias=AliasChoices("address", "住所"))
-    tax_id: Optional[str]     = Field(default=None, alias=AliasChoices("tax_id", "税番号", "法人番号", "インボイス番号"))
+    name: str = Field(validation_alias=AliasChoices("name", "名称", "会社名", "氏名"))
+    email: Optional[EmailStr] = Field(default=None, validation_alias=AliasChoices("email", "メール", "メールアドレス"))
+    phone: Optional[str]      = Field(default=None, validation_alias=AliasChoices("phone", "電話", "電話番号"))
+    address: Optional[str]    = Field(default=None, validation_alias=AliasChoices("address", "住所"))
+    tax_id: Optional[str]     = Field(default=None, validation_alias=AliasChoices("tax_id", "税番号", "法人番号", "インボイス番号"))
 
 class OrderItem(BaseModel):
     model_config = ConfigDict(populate_by_name=True)
 
-    sku: str  = Field(alias=AliasChoices("sku", "SKU", "型番", "品番"))
-    name: str = Field(alias=AliasChoices("name", "品名", "商品名"))
-    qty: int  = Field(gt=0, alias=AliasChoices("qty", "数量", "個数", "数"))
+    sku: str  = Field(validation_alias=AliasChoices("sku", "SKU", "型番", "品番"))
+    name: str = Field(validation_alias=AliasChoices("name", "品名", "商品名"))
+    qty: int  = Field(gt=0, validation_alias=AliasChoices("qty", "数量", "個数", "数"))
     # 金額系は >=0 / >0 を用途に応じて調整
-    unit_price: condecimal(gt=0, max_digits=12, decimal_places=2) = Field(alias=AliasChoices("unit_price", "単価", "単価（円）"))
-    discount:   condecimal(ge=0, max_digits=12, decimal_places=2) = Field(default=0, alias=AliasChoices("discount", "値引", "割引"))
+    unit_price: condecimal(gt=0, max_digits=12, decimal_places=2) = Field(validation_alias=AliasChoices("unit_price", "単価", "単価（円）"))
+    discount:   condecimal(ge=0, max_digits=12, decimal_places=2) = Field(default=0, validation_alias=AliasChoices("discount", "値引", "割引"))
 
 class Order(BaseModel):
     model_config = ConfigDict(populate_by_name=True)
 
-    template_id: str = Field(default="invoice_default_v1", alias=AliasChoices("template_id", "テンプレート"))
-    order_id: Optional[str] = Field(default=None, alias=AliasChoices("order_id", "注文番号", "請求書番号", "見積番号"))
-    issue_date: date = Field(alias=AliasChoices("issue_date", "発行日"))
-    due_date: Optional[date] = Field(default=None, alias=AliasChoices("due_date", "支払期日", "期日"))
+    template_id: str = Field(default="invoice_default_v1", validation_alias=AliasChoices("template_id", "テンプレート"))
+    order_id: Optional[str] = Field(default=None, validation_alias=AliasChoices("order_id", "注文番号", "請求書番号", "見積番号"))
+    issue_date: date = Field(validation_alias=AliasChoices("issue_date", "発行日"))
+    due_date: Optional[date] = Field(default=None, validation_alias=AliasChoices("due_date", "支払期日", "期日"))
 
-    seller: Party = Field(alias=AliasChoices("seller", "売り手", "発行者", "販売者", "請求元"))
-    buyer:  Party = Field(alias=AliasChoices("buyer", "買い手", "請求先", "顧客", "購入者"))
+    seller: Party = Field(validation_alias=AliasChoices("seller", "売り手", "発行者", "販売者", "請求元"))
+    buyer:  Party = Field(validation_alias=AliasChoices("buyer", "買い手", "請求先", "顧客", "購入者"))
 
-    currency: Currency = Field(default=Currency.JPY, alias=AliasChoices("currency", "通貨"))
+    currency: Currency = Field(default=Currency.JPY, validation_alias=AliasChoices("currency", "通貨"))
     payment_method: PaymentMethod = Field(default=PaymentMethod.BANK_TRANSFER,
-                                          alias=AliasChoices("payment_method", "支払方法", "お支払い方法"))
+                                          validation_alias=AliasChoices("payment_method", "支払方法", "お支払い方法"))
 
-    items: List[OrderItem] = Field(alias=AliasChoices("items", "明細", "商品明細", "内訳"))
+    items: List[OrderItem] = Field(validation_alias=AliasChoices("items", "明細", "商品明細", "内訳"))
 
     tax_rate_pct: condecimal(ge=0, le=100, max_digits=5, decimal_places=2) = Field(
-        default=10, alias=AliasChoices("tax_rate_pct", "消費税率", "税率")
+        default=10, validation_alias=AliasChoices("tax_rate_pct", "消費税率", "税率")
     )
     shipping_fee: condecimal(ge=0, max_digits=12, decimal_places=2) = Field(
-        default=0, alias=AliasChoices("shipping_fee", "送料", "配送料")
+        default=0, validation_alias=AliasChoices("shipping_fee", "送料", "配送料")
     )
-    notes: Optional[str] = Field(default=None, alias=AliasChoices("notes", "備考", "特記事項"))
+    notes: Optional[str] = Field(default=None, validation_alias=AliasChoices("notes", "備考", "特記事項"))
 
     # === 日本語値の正規化（必要に応じて拡張） ===
     @field_validator("currency", mode="before")
@@ -0,0 +1,142 @@
+import hmac
+import json
+import hashlib
+import secrets
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+from typing import List
+from pydantic import TypeAdapter
+from .schemas import (Order, OrderDraft, Party, PartyDraft, OrderItem, OrderItemDraft,
+                      Currency, PaymentMethod)
+
+
+@lru_cache(maxsize=None)
+def type_adapter(tp) -> TypeAdapter:
+    """按类型缓存 TypeAdapter（构建 core schema 有成本，每次请求新建很浪费）"""
+    return TypeAdapter(tp)
+
+
+ORDER_ADAPTER = type_adapter(Order)
+ORDER_LIST_ADAPTER = type_adapter(List[Order])
+
+
+def validate_order_json(body: bytes) -> Order:
+    # 直接由 pydantic-core 解析 JSON 字节，省掉 json.loads → dict → Order(**dict) 的中间步骤
+    return ORDER_ADAPTER.validate_json(body)
+
+
+# ===== 可信数据的快速构造（跳过校验） =====
+# 只用于本服务器自己产生、已经校验过的数据（LLM 抽取缓存、对话状态、已签名的最终 order）。
+# 和 model_construct 一样不做类型转换，所以 JSON 里的日期 / 金额 / 枚举在这里手动还原。
+# 不直接用 model_construct：它每次都遍历字段处理别名 / 默认值，明细一多反而比 pydantic-core 校验还慢。
+
+@lru_cache(maxsize=None)
+def _field_defaults(cls):
+    defaults = {name: f.default for name, f in cls.model_fields.items() if not f.is_required()}
+    return defaults, frozenset(cls.model_fields), frozenset(n for n, f in cls.model_fields.items() if f.is_required())
+
+
+def _new(cls, data):
+    """等价于 cls.model_construct(**data)（字段名、无 extra），缺少必填字段时 ValueError"""
+    defaults, names, required = _field_defaults(cls)
+    if not isinstance(data, dict) or not data.keys() <= names:
+        raise ValueError(f"unexpected keys for {cls.__name__}")
+    if not required <= data.keys():
+        raise ValueError(f"missing required fields for {cls.__name__}")
+    obj = cls.__new__(cls)
+    object.__setattr__(obj, "__dict__", {**defaults, **data})
+    object.__setattr__(obj, "__pydantic_fields_set__", set(data))
+    object.__setattr__(obj, "__pydantic_extra__", None)
+    object.__setattr__(obj, "__pydantic_private__", None)
+    return obj
+
+
+def _decimal(v):
+    if v is None:
+        return None
+    return Decimal(v) if isinstance(v, str) else Decimal(str(v))
+
+
+def _date(v):
+    if v is None or isinstance(v, date):
+        return v
+    if not isinstance(v, str):
+        raise ValueError(f"unexpected date value: {v!r}")
+    return date.fromisoformat(v)
+
+
+def _construct_party(cls, data):
+    if data is None:
+        return None
+    return _new(cls, data)
+
+
+def _construct_item(cls, data):
+    if not isinstance(data, dict):
+        raise ValueError(f"unexpected item for {cls.__name__}")
+    data = dict(data)
+    if data.get("qty") is not None:
+        data["qty"] = int(data["qty"])
+    for key in ("unit_price", "discount"):
+        if key in data:
+            data[key] = _decimal(data[key])
+    return _new(cls, data)
+
+
+def _construct(cls, party_cls, item_cls, data):
+    if not isinstance(data, dict):
+        raise ValueError(f"unexpected data for {cls.__name__}")
+    data = dict(data)
+    for key in ("issue_date", "due_date"):
+        if key in data:
+            data[key] = _date(data[key])
+    for key in ("tax_rate_pct", "shipping_fee"):
+        if key in data:
+            data[key] = _decimal(data[key])
+    if data.get("currency") is not None:
+        data["currency"] = Currency(data["currency"])
+    if data.get("payment_method") is not None:
+        data["payment_method"] = PaymentMethod(data["payment_method"])
+    for key in ("seller", "buyer"):
+        if key in data:
+            data[key] = _construct_party(party_cls, data[key])
+    if data.get("items") is not None:
+        data["items"] = [_construct_item(item_cls, it) for it in data["items"]]
+    return _new(cls, data)
+
+
+def construct_draft(data: dict) -> OrderDraft:
+    """服务器自己序列化的 OrderDraft（字段名、mode="json"）→ OrderDraft；形状不对时退回正常校验"""
+    # 只接住"数据形状不对"（ValueError / InvalidOperation）；TypeError 之类说明构造路径本身有问题，不吞掉
+    try:
+        return _construct(OrderDraft, PartyDraft, OrderItemDraft, data)
+    except (ValueError, InvalidOperation):
+        return OrderDraft(**data)
+
+
+def construct_order(data: dict) -> Order:
+    """服务器自己产生的 Order dump（字段名、mode="json"）→ Order；形状不对时退回正常校验"""
+    try:
+        return _construct(Order, Party, OrderItem, data)
+    except (ValueError, InvalidOperation):
+        return ORDER_ADAPTER.validate_python(data)
+
+
+# ===== 最终 order 的签名 =====
+# 对话结束时返回的 order 附带签名；前端原样提交生成 PDF 时，签名一致就走可信构造，不再重新校验。
+# 密钥每个进程随机生成：别的 worker / 重启前签发的签名对不上时只是退回正常校验。
+_ORDER_SIGNING_KEY = secrets.token_bytes(32)
+
+
+def _canonical(data) -> bytes:
+    return json.dumps(data, sort_keys=True, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def sign_order(order_json: dict) -> str:
+    """order_json: order.model_dump(mode="json") 的结果（即返回给前端的内容）"""
+    return hmac.new(_ORDER_SIGNING_KEY, _canonical(order_json), hashlib.sha256).hexdigest()
+
+
+def verify_order(order_json: dict, token) -> bool:
+    return bool(token) and hmac.compare_digest(sign_order(order_json), token)
@@ -0,0 +1,122 @@
+import re
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from pathlib import Path
+from commons.cache import TTLCache
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text):
+    # NFKC folds full-width/compatibility characters; runs of whitespace collapse to one space.
+    # The normalized text is also what gets classified, so cached and fresh results agree.
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+
+
+def model_fingerprint(weights_path, quantized=False):
+    # Changes whenever the checkpoint file is replaced or the model is loaded with a different
+    # precision (int8 and fp32 can disagree on borderline texts), which invalidates every cached result
+    st = Path(weights_path).stat()
+    precision = "int8" if quantized else "fp32"
+    return f"{Path(weights_path).name}:{st.st_size}:{st.st_mtime_ns}:{precision}"
+
+
+class ClassificationCache:
+    """
+    Cache of (label, confidence) per normalized text and model version.
+    L1 is an in-process LRU/TTL cache; L2 (optional) is a SQLite file that survives restarts.
+    """
+
+    def __init__(self, model_version, maxsize=100000, ttl=24 * 3600, sqlite_path=None):
+        self.model_version = model_version
+        self.ttl = ttl
+        self._memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.l2_hits = 0
+        self._db = None
+        self._db_lock = threading.Lock()
+        if sqlite_path:
+            self._db = sqlite3.connect(sqlite_path, check_same_thread=False)
+            with self._db_lock, self._db:
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS classification_cache ("
+                    "key TEXT PRIMARY KEY, model_version TEXT, label TEXT, confidence TEXT, created REAL)"
+                )
+                # Rows written by an older checkpoint can never be hit again
+                self._db.execute("DELETE FROM classification_cache WHERE model_version != ?", (model_version,))
+
+    def _key(self, normalized_text, variant):
+        # variant separates results computed with different preprocessing (e.g. padding mode)
+        return hashlib.sha256(f"{self.model_version}\0{variant}\0{normalized_text}".encode("utf-8")).hexdigest()
+
+    def get(self, normalized_text, variant=""):
+        key = self._key(normalized_text, variant)
+        result = self._memory.get(key)
+        if result is not None or self._db is None:
+            return result
+        return self._get_l2(key)
+
+    def _get_l2(self, key):
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT label, confidence, created FROM classification_cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or (self.ttl is not None and time.time() - row[2] > self.ttl):
+            return None
+        result = (row[0], row[1])
+        self.l2_hits += 1
+        self._memory.set(key, result)
+        return result
+
+    def put(self, normalized_text, result, variant=""):
+        key = self._key(normalized_text, variant)
+        self._memory.set(key, result)
+        if self._db is not None:
+            self._put_l2(key, result)
+
+    def _put_l2(self, key, result):
+        with self._db_lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO classification_cache VALUES (?, ?, ?, ?, ?)",
+                (key, self.model_version, result[0], result[1], time.time())
+            )
+
+    # Async variants for event-loop handlers: L1 stays inline, only the SQLite round trip
+    # (which can wait on the file lock) goes to a worker thread.
+    async def aget(self, normalized_text, variant=""):
+        key = self._key(normalized_text, variant)
+        result = self._memory.get(key)
+        if result is not None or self._db is None:
+            return result
+        return await asyncio.to_thread(self._get_l2, key)
+
+    async def aput(self, normalized_text, result, variant=""):
+        key = self._key(normalized_text, variant)
+        self._memory.set(key, result)
+        if self._db is not None:
+            await asyncio.to_thread(self._put_l2, key, result)
+
+    def classify_many(self, normalized_texts, classify_fn, variant=""):
+        """
+        Look up every text, run classify_fn once on the distinct misses, fill the cache
+        and return results in input order.
+        """
+        results = [self.get(text, variant) for text in normalized_texts]
+        misses = list(dict.fromkeys(text for text, result in zip(normalized_texts, results) if result is None))
+        if misses:
+            fresh = dict(zip(misses, classify_fn(misses)))
+            for text, result in fresh.items():
+                self.put(text, result, variant)
+            results = [fresh[text] if result is None else result
+                       for text, result in zip(normalized_texts, results)]
+        return results
+
+    def stats(self):
+        stats = self._memory.stats()
+        stats["l2_hits"] = self.l2_hits
+        stats["l2_enabled"] = self._db is not None
+        stats["model_version"] = self.model_version
+        return stats
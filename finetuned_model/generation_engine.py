@@ -0,0 +1,243 @@
+import asyncio
+import queue
+import threading
+from concurrent.futures import Future
+
+import torch
+import torch.nn.functional as F
+from mygpt import KVCache
+from load_generator import (sample_next_token, text_to_token_ids, token_ids_to_text, extract_response,
+                            IncrementalDecoder, ResponseStreamFilter)
+
+
+class _Sequence:
+    def __init__(self, prompt_ids, max_new_tokens, future, on_token, cancelled):
+        self.prompt_ids = prompt_ids
+        self.max_new_tokens = max_new_tokens
+        self.future = future
+        self.on_token = on_token
+        self.cancelled = cancelled  # threading.Event or None; once set, the sequence leaves the batch
+        self.generated = []
+        self.length = 0          # Number of positions held in the KV cache
+        self.last_token = None   # Token to feed at the next decode step
+
+
+class GenerationEngine:
+    """
+    Continuous batching for GPTModel generation (iteration-level scheduling).
+
+    A background thread keeps one decode batch running. New prompts are prefilled
+    individually and merged into the batch as soon as a slot is free; sequences that
+    hit EOS / max_new_tokens / context_size leave the batch at once. The batched KV
+    cache is left-padded, with a key mask marking the padding and per-row position ids.
+    """
+
+    def __init__(self, model, context_size, eos_id=None, max_batch_size=8, max_new_tokens=35,
+                 temperature=0.0, top_k=None):
+        self.model = model
+        self.context_size = context_size
+        self.eos_id = eos_id
+        self.max_batch_size = max_batch_size
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.top_k = top_k
+
+        self._pending = queue.Queue()
+        self._active = []
+        self._kv_cache = None
+        self._key_mask = None  # (n_active, cache_len) bool, True = valid position
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, prompt_ids, max_new_tokens=None, on_token=None, cancelled=None):
+        """
+        Queue a prompt (list of token ids). Returns a concurrent.futures.Future resolving to
+        prompt_ids + generated ids. on_token(token_id) is called from the engine thread for
+        every generated token. Setting the threading.Event `cancelled` stops generation before
+        the next decode step; the future then resolves to the ids generated so far.
+        """
+        self._ensure_thread()
+        future = Future()
+        self._pending.put(_Sequence(
+            list(prompt_ids), max_new_tokens or self.max_new_tokens, future, on_token, cancelled
+        ))
+        return future
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="generation-engine", daemon=True)
+                self._thread.start()
+
+    def _loop(self):
+        while True:
+            if not self._active:
+                self._admit(self._pending.get())  # Idle: block until a request arrives
+            while len(self._active) < self.max_batch_size:
+                try:
+                    self._admit(self._pending.get_nowait())
+                except queue.Empty:
+                    break
+            if self._active:
+                try:
+                    self._step()
+                except Exception as e:
+                    for seq in self._active:
+                        if not seq.future.done():
+                            seq.future.set_exception(e)
+                    self._active, self._kv_cache, self._key_mask = [], None, None
+
+    def _admit(self, seq):
+        if not seq.future.set_running_or_notify_cancel():
+            return
+        if _is_cancelled(seq):
+            self._finish(seq)
+            return
+        try:
+            prompt_ids = seq.prompt_ids[-self.context_size:]
+            kv_cache = KVCache(len(self.model.trf_blocks))
+            with torch.no_grad():
+                logits = self.model(torch.tensor([prompt_ids]), kv_cache=kv_cache)[:, -1, :]
+            seq.length = len(prompt_ids)
+            token = sample_next_token(logits, self.temperature, self.top_k).item()
+            if self._emit(seq, token):
+                self._merge(seq, kv_cache)
+        except Exception as e:
+            if not seq.future.done():
+                seq.future.set_exception(e)
+
+    def _step(self):
+        keep = [i for i, seq in enumerate(self._active) if not _is_cancelled(seq)]
+        if len(keep) < len(self._active):
+            for seq in self._active:
+                if _is_cancelled(seq):
+                    self._finish(seq)
+            self._evict(keep)
+            if not self._active:
+                return
+
+        n = len(self._active)
+        in_idx = torch.tensor([[seq.last_token] for seq in self._active])
+        pos_ids = torch.tensor([[seq.length] for seq in self._active])
+        key_mask = torch.cat([self._key_mask, torch.ones(n, 1, dtype=torch.bool)], dim=1)
+
+        with torch.no_grad():
+            logits = self.model(in_idx, kv_cache=self._kv_cache, pos_ids=pos_ids, attn_mask=key_mask)[:, -1, :]
+        self._key_mask = key_mask
+
+        next_tokens = sample_next_token(logits, self.temperature, self.top_k).squeeze(1).tolist()
+        keep = []
+        for i, (seq, token) in enumerate(zip(self._active, next_tokens)):
+            seq.length += 1
+            if self._emit(seq, token):
+                keep.append(i)
+        if len(keep) < n:
+            self._evict(keep)
+
+    def _emit(self, seq, token):
+        # Returns True while the sequence should stay in the decode batch
+        if self.eos_id is not None and token == self.eos_id:
+            self._finish(seq)
+            return False
+        seq.generated.append(token)
+        seq.last_token = token
+        if seq.on_token is not None:
+            seq.on_token(token)
+        if len(seq.generated) >= seq.max_new_tokens or seq.length >= self.context_size:
+            self._finish(seq)
+            return False
+        return True
+
+    def _finish(self, seq):
+        seq.future.set_result(seq.prompt_ids + seq.generated)
+
+    def _merge(self, seq, kv_cache):
+        key_mask = torch.ones(1, seq.length, dtype=torch.bool)
+        if not self._active:
+            self._active, self._kv_cache, self._key_mask = [seq], kv_cache, key_mask
+            return
+
+        # Left-pad both caches to the same length so the newest positions line up on the right
+        cache_len = max(self._key_mask.shape[1], seq.length)
+        for layer_idx in range(len(kv_cache.keys)):
+            self._kv_cache.keys[layer_idx] = torch.cat([
+                _left_pad(self._kv_cache.keys[layer_idx], cache_len),
+                _left_pad(kv_cache.keys[layer_idx], cache_len),
+            ])
+            self._kv_cache.values[layer_idx] = torch.cat([
+                _left_pad(self._kv_cache.values[layer_idx], cache_len),
+                _left_pad(kv_cache.values[layer_idx], cache_len),
+            ])
+        self._key_mask = torch.cat([
+            F.pad(self._key_mask, (cache_len - self._key_mask.shape[1], 0), value=False),
+            F.pad(key_mask, (cache_len - seq.length, 0), value=False),
+        ])
+        self._active.append(seq)
+
+    def _evict(self, keep):
+        if not keep:
+            self._active, self._kv_cache, self._key_mask = [], None, None
+            return
+
+        rows = torch.tensor(keep)
+        key_mask = self._key_mask.index_select(0, rows)
+        # Drop leading columns that are padding for every remaining row
+        first = int(key_mask.any(dim=0).nonzero()[0])
+        for layer_idx in range(len(self._kv_cache.keys)):
+            self._kv_cache.keys[layer_idx] = self._kv_cache.keys[layer_idx].index_select(0, rows)[:, :, first:]
+            self._kv_cache.values[layer_idx] = self._kv_cache.values[layer_idx].index_select(0, rows)[:, :, first:]
+        self._key_mask = key_mask[:, first:]
+        self._active = [self._active[i] for i in keep]
+
+
+def _is_cancelled(seq):
+    return seq.cancelled is not None and seq.cancelled.is_set()
+
+
+def _left_pad(t, length):
+    # (b, num_heads, num_tokens, head_dim) -> (b, num_heads, length, head_dim)
+    return F.pad(t, (0, 0, length - t.shape[2], 0))
+
+
+async def generate_text_async(prompt_text, engine, gen_tokenizer):
+    prompt_ids = text_to_token_ids(prompt_text, gen_tokenizer).squeeze(0).tolist()
+    token_ids = await asyncio.wrap_future(engine.submit(prompt_ids))
+    return extract_response(prompt_text, token_ids_to_text(torch.tensor(token_ids), gen_tokenizer))
+
+
+async def stream_text_async(prompt_text, engine, gen_tokenizer):
+    """
+    Async generator yielding decoded text pieces as the engine produces tokens.
+    The pieces go through ResponseStreamFilter, so their concatenation equals
+    generate_text_async's result (marker removed, whitespace stripped at both ends).
+    If the caller stops iterating (e.g. the client disconnected), the sequence is
+    cancelled and leaves the decode batch at the next step.
+    """
+    loop = asyncio.get_running_loop()
+    tokens = asyncio.Queue()
+    cancelled = threading.Event()
+    prompt_ids = text_to_token_ids(prompt_text, gen_tokenizer).squeeze(0).tolist()
+
+    # Engine thread -> event loop; the done callback queues the end marker after the last token
+    future = engine.submit(prompt_ids, on_token=lambda t: loop.call_soon_threadsafe(tokens.put_nowait, t),
+                           cancelled=cancelled)
+    future.add_done_callback(lambda _: loop.call_soon_threadsafe(tokens.put_nowait, None))
+
+    decoder = IncrementalDecoder(gen_tokenizer)
+    response = ResponseStreamFilter()
+    try:
+        while True:
+            token = await tokens.get()
+            if token is None:
+                text = response.feed(decoder.flush()) + response.flush()
+            else:
+                text = response.feed(decoder.decode(token))
+            if text:
+                yield text
+            if token is None:
+                break
+    finally:
+        cancelled.set()
+
+    # Surface engine errors to the caller
+    future.result()
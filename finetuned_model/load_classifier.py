@@ -1,7 +1,10 @@
 import torch
 import torch.nn.functional as F
 import tiktoken
+from pathlib import Path
 from mygpt import GPTModel
+from quantization import quantize_dynamic_int8
+from mmap_weights import convert_checkpoint, needs_conversion, load_into
 from commons.myutils import download_model_from_s3
 
 BASE_CONFIG = {
@@ -22,41 +25,51 @@ CHOOSE_MODEL = "gpt2-small (124M)"
 
 BASE_CONFIG.update(model_configs[CHOOSE_MODEL])
 
-def load_model_and_tokenizer():
-    model_path = "review_classifier.pth"
-    download_model_from_s3(
-        bucket_name="llm-demo-models",
-        object_key="models/review_classifier.pth",
-        local_path=model_path
-    )
-
-    from pathlib import Path
+# mmap-able copy of the checkpoint, converted from the .pth (see mmap_weights.py)
+WEIGHTS_PATH = Path("review_classifier.safetensors")
 
+def load_model_and_tokenizer(quantize=False):
+    weights_path = WEIGHTS_PATH
     finetuned_model_path = Path("review_classifier.pth")
-    if not finetuned_model_path.exists():
-        print(
-            f"Could not find '{finetuned_model_path}'.\n"
-            "Run the `ch06.ipynb` notebook to finetune and save the finetuned model."
+    if not weights_path.exists():
+        model_path = "review_classifier.pth"
+        download_model_from_s3(
+            bucket_name="llm-demo-models",
+            object_key="models/review_classifier.pth",
+            local_path=model_path
         )
 
+        if not finetuned_model_path.exists():
+            print(
+                f"Could not find '{finetuned_model_path}'.\n"
+                "Run the `ch06.ipynb` notebook to finetune and save the finetuned model."
+            )
+    # Also reconverts when the .pth was re-downloaded or retrained after the last conversion
+    if needs_conversion(finetuned_model_path, weights_path):
+        convert_checkpoint(finetuned_model_path, weights_path)
+
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    if quantize:
+        # Dynamic int8 kernels are CPU only
+        device = torch.device("cpu")
 
     tokenizer = tiktoken.get_encoding("gpt2")
-    
-    # Initialize base model
-    model = GPTModel(BASE_CONFIG)
-    # Convert model to classifier as in section 6.5 in ch06.ipynb
-    num_classes = 2
-    model.out_head = torch.nn.Linear(in_features=BASE_CONFIG["emb_dim"], out_features=num_classes)
-
-    # Then load pretrained weights
-    model.load_state_dict(torch.load("review_classifier.pth", map_location=device, weights_only=True))
+
+    def build_classifier():
+        # Initialize base model
+        model = GPTModel(BASE_CONFIG)
+        # Convert model to classifier as in section 6.5 in ch06.ipynb
+        num_classes = 2
+        model.out_head = torch.nn.Linear(in_features=BASE_CONFIG["emb_dim"], out_features=num_classes)
+        return model
+
+    # Then load pretrained weights (read-only mmap, the page cache is shared by all workers)
+    model = load_into(build_classifier, weights_path)
     model.to(device)
     model.eval()
+    if quantize:
+        model = quantize_dynamic_int8(model)
 
-    # delete the pth file
-    #finetuned_model_path.unlink()
-    
     return model, tokenizer, device
 
 def classify_review(text, model, tokenizer, device, max_length=120, pad_token_id=50256):
@@ -85,3 +98,51 @@ def classify_review(text, model, tokenizer, device, max_length=120, pad_token_id
     label = "spam" if predicted_label == 1 else "not spam"
     return label, confidence
 
+
+def classify_batch(texts, model, tokenizer, device, max_length=120, pad_token_id=50256,
+                   batch_size=64, pad_to_longest=False):
+    """
+    Classify a list of texts, returning [(label, confidence), ...] in input order.
+
+    pad_to_longest=False (default) pads to max_length and reads the last position, exactly
+    like classify_review and the fine-tuning setup, so results match /api/predict.
+    pad_to_longest=True pads each chunk only to its longest sequence and reads the logits
+    at every sequence's last real token. That is cheaper for short texts, but the classifier
+    head was trained on the padded last position, so labels and confidences can differ.
+    """
+    model.eval()
+
+    supported_context_length = model.pos_emb.weight.shape[0]
+    max_len = min(max_length, supported_context_length)
+    encoded = [tokenizer.encode(text)[:max_len] or [pad_token_id] for text in texts]
+
+    # Sort by length so that every chunk holds sequences of similar size (less padding)
+    order = sorted(range(len(encoded)), key=lambda i: len(encoded[i]))
+    results = [None] * len(encoded)
+
+    for start in range(0, len(order), batch_size):
+        chunk = order[start:start + batch_size]
+        lengths = [len(encoded[i]) for i in chunk]
+        pad_len = max(lengths) if pad_to_longest else max_length
+        input_tensor = torch.tensor(
+            [encoded[i] + [pad_token_id] * (pad_len - len(encoded[i])) for i in chunk],
+            device=device
+        )
+        if pad_to_longest:
+            last_token_idx = torch.tensor(lengths, device=device) - 1
+        else:
+            last_token_idx = torch.full((len(chunk),), pad_len - 1, device=device)
+
+        # Model inference
+        with torch.no_grad():
+            logits = model(input_tensor)
+            logits = logits[torch.arange(len(chunk), device=device), last_token_idx]
+            probs = F.softmax(logits, dim=-1)
+            predicted_labels = torch.argmax(probs, dim=-1)
+            confidences = probs.gather(1, predicted_labels.unsqueeze(1)).squeeze(1)
+
+        for i, predicted_label, confidence in zip(chunk, predicted_labels.tolist(), confidences.tolist()):
+            label = "spam" if predicted_label == 1 else "not spam"
+            results[i] = (label, f"{confidence:.2f}")
+
+    return results
@@ -1,7 +1,10 @@
+import codecs
 import torch
 import tiktoken
 from pathlib import Path
-from mygpt import GPTModel
+from mygpt import GPTModel, KVCache
+from quantization import quantize_dynamic_int8
+from mmap_weights import convert_checkpoint, needs_conversion, load_into
 from commons.myutils import download_model_from_s3
 
 BASE_CONFIG = {
@@ -11,18 +14,24 @@ BASE_CONFIG = {
     "qkv_bias": True         # Query-key-value bias
 }
 
-def load_generation_model():
-    model_path = "gpt2-medium355M-sft.pth"
-    download_model_from_s3(
-        bucket_name="llm-demo-models",
-        object_key="models/gpt2-medium355M-sft.pth",
-        local_path=model_path
-    )
-
+def load_generation_model(quantize=False):
+    # mmap-able copy of the checkpoint, converted from the .pth (see mmap_weights.py)
+    weights_path = Path("gpt2-medium355M-sft.safetensors")
     finetuned_model_path = Path("gpt2-medium355M-sft.pth")
-    if not finetuned_model_path.exists():
-        print(f"Could not find '{finetuned_model_path}'.\n"
-              "Run the `ch07.ipynb` notebook to finetune and save the finetuned model.")
+    if not weights_path.exists():
+        model_path = "gpt2-medium355M-sft.pth"
+        download_model_from_s3(
+            bucket_name="llm-demo-models",
+            object_key="models/gpt2-medium355M-sft.pth",
+            local_path=model_path
+        )
+
+        if not finetuned_model_path.exists():
+            print(f"Could not find '{finetuned_model_path}'.\n"
+                  "Run the `ch07.ipynb` notebook to finetune and save the finetuned model.")
+    # Also reconverts when the .pth was re-downloaded or retrained after the last conversion
+    if needs_conversion(finetuned_model_path, weights_path):
+        convert_checkpoint(finetuned_model_path, weights_path)
 
     model_configs = {
         "gpt2-small (124M)": {"emb_dim": 768, "n_layers": 12, "n_heads": 12},
@@ -36,13 +45,11 @@ def load_generation_model():
     BASE_CONFIG.update(model_configs[CHOOSE_MODEL])
 
     model_size = CHOOSE_MODEL.split(" ")[-1].lstrip("(").rstrip(")")
-    gen_model = GPTModel(BASE_CONFIG)
-    gen_model.load_state_dict(torch.load(
-        "gpt2-medium355M-sft.pth",
-        map_location=torch.device("cpu"),
-        weights_only=True
-    ))
+    # Weights are a read-only mmap, the page cache is shared by all worker processes
+    gen_model = load_into(lambda: GPTModel(BASE_CONFIG), weights_path)
     gen_model.eval()
+    if quantize:
+        gen_model = quantize_dynamic_int8(gen_model)
 
     gen_tokenizer = tiktoken.get_encoding("gpt2")
 
@@ -59,50 +66,110 @@ def generate_text(prompt_text, gen_model, gen_tokenizer):
         eos_id=50256
     )
 
-    response = token_ids_to_text(token_ids, gen_tokenizer)
-    response = response[len(prompt_text):].replace("### Response:", "").strip()
+    return extract_response(prompt_text, token_ids_to_text(token_ids, gen_tokenizer))
 
-    return response
 
+RESPONSE_MARKER = "### Response:"
 
-def generate(model, idx, max_new_tokens, context_size, temperature=0.0, top_k=None, eos_id=None):
 
-    # For-loop is the same as before: Get logits, and only focus on last time step
+def extract_response(prompt_text, full_text):
+    # Drop the echoed prompt and the instruction-format marker
+    return full_text[len(prompt_text):].replace(RESPONSE_MARKER, "").strip()
+
+
+def generate(model, idx, max_new_tokens, context_size, temperature=0.0, top_k=None, eos_id=None, use_cache=True):
+
+    if not use_cache:
+        return generate_uncached(model, idx, max_new_tokens, context_size, temperature, top_k, eos_id)
+
+    for idx_next in generate_stream(model, idx, max_new_tokens, context_size, temperature, top_k, eos_id):
+        idx = torch.cat((idx, idx_next), dim=1)  # (batch_size, num_tokens+1)
+
+    return idx
+
+
+def generate_stream(model, idx, max_new_tokens, context_size, temperature=0.0, top_k=None, eos_id=None):
+    # Same as generate(), but yields each new (batch_size, 1) token tensor as soon as it is sampled
+
+    n_layers = len(model.trf_blocks)
+    kv_cache = None
+    finished = torch.zeros(idx.shape[0], dtype=torch.bool, device=idx.device)
+
     for _ in range(max_new_tokens):
-        idx_cond = idx[:, -context_size:]
         with torch.no_grad():
-            logits = model(idx_cond)
+            # Prefill (or re-prefill once the window is full) over the last context_size tokens,
+            # afterwards only the newest token is fed and past keys/values come from the cache
+            if kv_cache is None or kv_cache.seq_len >= context_size:
+                kv_cache = KVCache(n_layers)
+                logits = model(idx[:, -context_size:], kv_cache=kv_cache)
+            else:
+                logits = model(idx[:, -1:], kv_cache=kv_cache)
         logits = logits[:, -1, :]
 
-        # New: Filter logits with top_k sampling
-        if top_k is not None:
-            # Keep only top_k values
-            top_logits, _ = torch.topk(logits, top_k)
-            min_val = top_logits[:, -1]
-            logits = torch.where(logits < min_val, torch.tensor(float('-inf')).to(logits.device), logits)
+        idx_next = sample_next_token(logits, temperature, top_k)
+
+        # Per-sequence EOS: finished rows keep emitting eos_id, stop once every row has finished
+        if eos_id is not None:
+            finished |= idx_next.squeeze(1) == eos_id
+            if finished.all():
+                break
+            idx_next = torch.where(finished.unsqueeze(1), torch.full_like(idx_next, eos_id), idx_next)
+
+        idx = torch.cat((idx, idx_next), dim=1)  # (batch_size, num_tokens+1)
+        yield idx_next
 
-        # New: Apply temperature scaling
-        if temperature > 0.0:
-            logits = logits / temperature
 
-            # Apply softmax to get probabilities
-            probs = torch.softmax(logits, dim=-1)  # (batch_size, context_len)
+def generate_uncached(model, idx, max_new_tokens, context_size, temperature=0.0, top_k=None, eos_id=None):
 
-            # Sample from the distribution
-            idx_next = torch.multinomial(probs, num_samples=1)  # (batch_size, 1)
+    finished = torch.zeros(idx.shape[0], dtype=torch.bool, device=idx.device)
 
-        # Otherwise same as before: get idx of the vocab entry with the highest logits value
-        else:
-            idx_next = torch.argmax(logits, dim=-1, keepdim=True)  # (batch_size, 1)
+    # For-loop is the same as before: Get logits, and only focus on last time step
+    for _ in range(max_new_tokens):
+        idx_cond = idx[:, -context_size:]
+        with torch.no_grad():
+            logits = model(idx_cond)
+        logits = logits[:, -1, :]
 
-        if idx_next == eos_id:  # Stop generating early if end-of-sequence token is encountered and eos_id is specified
-            break
+        idx_next = sample_next_token(logits, temperature, top_k)
+
+        # Per-sequence EOS: finished rows keep emitting eos_id, stop once every row has finished
+        if eos_id is not None:
+            finished |= idx_next.squeeze(1) == eos_id
+            if finished.all():
+                break
+            idx_next = torch.where(finished.unsqueeze(1), torch.full_like(idx_next, eos_id), idx_next)
 
         # Same as before: append sampled index to the running sequence
         idx = torch.cat((idx, idx_next), dim=1)  # (batch_size, num_tokens+1)
 
     return idx
 
+
+def sample_next_token(logits, temperature=0.0, top_k=None):
+
+    # New: Filter logits with top_k sampling
+    if top_k is not None:
+        # Keep only top_k values
+        top_logits, _ = torch.topk(logits, top_k)
+        min_val = top_logits[:, -1:]  # (batch_size, 1), broadcasts per row
+        logits = torch.where(logits < min_val, torch.tensor(float('-inf')).to(logits.device), logits)
+
+    # New: Apply temperature scaling
+    if temperature > 0.0:
+        logits = logits / temperature
+
+        # Apply softmax to get probabilities
+        probs = torch.softmax(logits, dim=-1)  # (batch_size, context_len)
+
+        # Sample from the distribution
+        idx_next = torch.multinomial(probs, num_samples=1)  # (batch_size, 1)
+
+    # Otherwise same as before: get idx of the vocab entry with the highest logits value
+    else:
+        idx_next = torch.argmax(logits, dim=-1, keepdim=True)  # (batch_size, 1)
+
+    return idx_next
+
 def text_to_token_ids(text, tokenizer):
     encoded = tokenizer.encode(text, allowed_special={"<|endoftext|>"})
     encoded_tensor = torch.tensor(encoded).unsqueeze(0)  # add batch dimension
@@ -111,3 +178,70 @@ def text_to_token_ids(text, tokenizer):
 def token_ids_to_text(token_ids, tokenizer):
     flat = token_ids.squeeze(0)  # remove batch dimension
     return tokenizer.decode(flat.tolist())
+
+
+class IncrementalDecoder:
+    """
+    Token-by-token detokenizer for streaming. A GPT-2 BPE token can end in the middle of a
+    multi-byte UTF-8 character, so raw token bytes are fed through an incremental UTF-8
+    decoder that holds back incomplete sequences until the next token completes them.
+    """
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    def decode(self, token_id):
+        return self._decoder.decode(self.tokenizer.decode_single_token_bytes(token_id))
+
+    def flush(self):
+        return self._decoder.decode(b"", final=True)
+
+
+class ResponseStreamFilter:
+    """
+    Streaming counterpart of extract_response for the generated text: removes RESPONSE_MARKER
+    even when it is split across pieces, drops leading whitespace, and holds back trailing
+    whitespace until more text follows (discarded at the end), so the concatenated output
+    equals extract_response's result.
+    """
+
+    def __init__(self, marker=RESPONSE_MARKER):
+        self.marker = marker
+        self._pending = ""   # Tail that might be the start of a marker
+        self._held = ""      # Whitespace not yet known to be inside the response
+        self._started = False
+
+    def feed(self, text):
+        # Single left-to-right pass like str.replace: text before a removed marker is final
+        buf = self._pending + text
+        parts = []
+        i = buf.find(self.marker)
+        while i >= 0:
+            parts.append(buf[:i])
+            buf = buf[i + len(self.marker):]
+            i = buf.find(self.marker)
+        keep = next((k for k in range(min(len(self.marker) - 1, len(buf)), 0, -1)
+                     if buf.endswith(self.marker[:k])), 0)
+        parts.append(buf[:len(buf) - keep])
+        self._pending = buf[len(buf) - keep:]
+        return self._emit("".join(parts))
+
+    def flush(self):
+        text = self._emit(self._pending)  # A held tail here never completed a marker
+        self._pending = self._held = ""
+        return text
+
+    def _emit(self, text):
+        if not self._started:
+            text = text.lstrip()
+            if not text:
+                return ""
+            self._started = True
+        body = text.rstrip()
+        if not body:
+            self._held += text
+            return ""
+        out = self._held + body
+        self._held = text[len(body):]
+        return out
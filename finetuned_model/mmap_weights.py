@@ -0,0 +1,134 @@
+import os
+import json
+import struct
+import warnings
+from pathlib import Path
+
+import numpy as np
+import torch
+from mygpt import fuse_qkv_state_dict
+
+# safetensors-compatible layout: 8-byte little-endian header size, JSON header, raw tensor bytes.
+# Tensors are loaded as read-only views of one np.memmap, so every worker process that opens
+# the same file shares the OS page cache instead of holding a private copy of the weights.
+
+_DTYPES = {
+    torch.float32: "F32",
+    torch.float16: "F16",
+    torch.bfloat16: "BF16",
+    torch.int64: "I64",
+    torch.int32: "I32",
+    torch.uint8: "U8",
+    torch.bool: "BOOL",
+}
+_TORCH_DTYPES = {name: dtype for dtype, name in _DTYPES.items()}
+
+
+def save_mmap_weights(state_dict, path, metadata=None):
+    path = Path(path)
+    # Larger element types first keeps every tensor aligned to its element size
+    names = sorted(state_dict, key=lambda k: -state_dict[k].element_size())
+
+    header, offset = {}, 0
+    for name in names:
+        tensor = state_dict[name]
+        nbytes = tensor.numel() * tensor.element_size()
+        header[name] = {
+            "dtype": _DTYPES[tensor.dtype],
+            "shape": list(tensor.shape),
+            "data_offsets": [offset, offset + nbytes],
+        }
+        offset += nbytes
+
+    if metadata:
+        # safetensors allows a string -> string "__metadata__" entry; loaders skip it
+        header = {"__metadata__": {k: str(v) for k, v in metadata.items()}, **header}
+    header_bytes = json.dumps(header).encode("utf-8")
+    header_bytes += b" " * (-len(header_bytes) % 8)
+
+    # Write to a temp file and rename, so concurrent workers never see a half-written file
+    tmp_path = path.with_name(path.name + f".tmp{os.getpid()}")
+    with open(tmp_path, "wb") as f:
+        f.write(struct.pack("<Q", len(header_bytes)))
+        f.write(header_bytes)
+        for name in names:
+            tensor = state_dict[name].detach().cpu().contiguous()
+            f.write(tensor.reshape(-1).view(torch.uint8).numpy().tobytes())
+    os.replace(tmp_path, path)
+
+
+def _read_header(path):
+    with open(path, "rb") as f:
+        header_size = struct.unpack("<Q", f.read(8))[0]
+        return header_size, json.loads(f.read(header_size))
+
+
+def read_metadata(path):
+    return _read_header(path)[1].get("__metadata__", {})
+
+
+def load_mmap_weights(path):
+    header_size, header = _read_header(path)
+    header.pop("__metadata__", None)
+
+    data = np.memmap(path, dtype=np.uint8, mode="r", offset=8 + header_size)
+    state_dict = {}
+    with warnings.catch_warnings():
+        # torch warns that the memmap is not writable; the weights are only ever read
+        warnings.simplefilter("ignore", UserWarning)
+        for name, info in header.items():
+            begin, end = info["data_offsets"]
+            raw = torch.from_numpy(data[begin:end])
+            state_dict[name] = raw.view(_TORCH_DTYPES[info["dtype"]]).reshape(info["shape"])
+    return state_dict
+
+
+def source_fingerprint(pth_path):
+    # Changes whenever the checkpoint is re-downloaded or retrained
+    st = Path(pth_path).stat()
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+
+def convert_checkpoint(pth_path, out_path):
+    state_dict = torch.load(pth_path, map_location="cpu", weights_only=True)
+    # Store the fused W_qkv layout so loading stays zero-copy
+    save_mmap_weights(fuse_qkv_state_dict(state_dict), out_path,
+                      metadata={"source": Path(pth_path).name, "source_fingerprint": source_fingerprint(pth_path)})
+
+
+def needs_conversion(pth_path, out_path):
+    """
+    True when out_path is missing or was converted from a different version of pth_path.
+    Without the .pth (e.g. deleted to save disk) the existing converted file is used as is.
+    """
+    out_path, pth_path = Path(out_path), Path(pth_path)
+    if not out_path.exists():
+        return True
+    if not pth_path.exists():
+        return False
+    try:
+        return read_metadata(out_path).get("source_fingerprint") != source_fingerprint(pth_path)
+    except (OSError, ValueError, struct.error):
+        return True  # Unreadable header: convert again
+
+
+def load_into(model_factory, weights_path):
+    """
+    Build the model on the meta device (no random init, no allocation) and attach the
+    mmap'd tensors directly as its parameters/buffers.
+    """
+    with torch.device("meta"):
+        model = model_factory()
+    model.load_state_dict(load_mmap_weights(weights_path), assign=True)
+    return model
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convert a .pth checkpoint to the mmap-able weight format")
+    parser.add_argument("pth_path")
+    parser.add_argument("out_path")
+    args = parser.parse_args()
+    convert_checkpoint(args.pth_path, args.out_path)
+    print(f"Wrote {args.out_path}")
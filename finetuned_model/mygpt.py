@@ -1,44 +1,113 @@
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
+
+
+class KVCache:
+    def __init__(self, n_layers):
+        self.keys = [None] * n_layers
+        self.values = [None] * n_layers
+
+    @property
+    def seq_len(self):
+        return 0 if self.keys[0] is None else self.keys[0].shape[2]
+
+    def update(self, layer_idx, keys, values):
+        if self.keys[layer_idx] is not None:
+            keys = torch.cat([self.keys[layer_idx], keys], dim=2)
+            values = torch.cat([self.values[layer_idx], values], dim=2)
+        self.keys[layer_idx] = keys
+        self.values[layer_idx] = values
+        return keys, values
+
+
+def fuse_qkv_state_dict(state_dict):
+    # Checkpoints store separate W_query/W_key/W_value; merge them into W_qkv in place
+    prefixes = [k[:-len("W_query.weight")] for k in list(state_dict) if k.endswith("W_query.weight")]
+    for prefix in prefixes:
+        _fuse_qkv(state_dict, prefix)
+    return state_dict
+
+
+def _fuse_qkv(state_dict, prefix):
+    for param in ("weight", "bias"):
+        names = [f"{prefix}{w}.{param}" for w in ("W_query", "W_key", "W_value")]
+        if all(name in state_dict for name in names):
+            state_dict[f"{prefix}W_qkv.{param}"] = torch.cat([state_dict.pop(name) for name in names], dim=0)
 
 
 class MultiHeadAttention(nn.Module):
-    def __init__(self, d_in, d_out, context_length, dropout, num_heads, qkv_bias=False):
+    def __init__(self, d_in, d_out, context_length, dropout, num_heads, qkv_bias=False, attn_backend="sdpa"):
         super().__init__()
         assert d_out % num_heads == 0, "d_out must be divisible by num_heads"
+        assert attn_backend in ("sdpa", "eager"), "attn_backend must be 'sdpa' or 'eager'"
 
         self.d_out = d_out
         self.num_heads = num_heads
         self.head_dim = d_out // num_heads
+        self.attn_backend = attn_backend
 
-        self.W_query = nn.Linear(d_in, d_out, bias=qkv_bias)
-        self.W_key = nn.Linear(d_in, d_out, bias=qkv_bias)
-        self.W_value = nn.Linear(d_in, d_out, bias=qkv_bias)
+        # Query/key/value projections fused into one matmul (rows: query, key, value)
+        self.W_qkv = nn.Linear(d_in, 3 * d_out, bias=qkv_bias)
         self.out_proj = nn.Linear(d_out, d_out)
         self.dropout = nn.Dropout(dropout)
         self.register_buffer("mask", torch.triu(torch.ones(context_length, context_length), diagonal=1))
+        self._mask_bool = None
 
-    def forward(self, x):
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        _fuse_qkv(state_dict, prefix)
+        super()._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+
+    def _causal_mask(self, num_tokens, num_keys):
+        # Bool copy of the registered float mask, converted once instead of on every call
+        if self._mask_bool is None or self._mask_bool.device != self.mask.device:
+            self._mask_bool = self.mask.bool()
+        return self._mask_bool[num_keys - num_tokens:num_keys, :num_keys]
+
+    def forward(self, x, kv_cache=None, layer_idx=0, attn_mask=None):
         b, num_tokens, d_in = x.shape
 
-        keys = self.W_key(x)
-        queries = self.W_query(x)
-        values = self.W_value(x)
+        qkv = self.W_qkv(x).view(b, num_tokens, 3, self.num_heads, self.head_dim)
+        queries, keys, values = qkv.permute(2, 0, 3, 1, 4).unbind(0)
+
+        if kv_cache is not None:
+            keys, values = kv_cache.update(layer_idx, keys, values)
+        num_keys = keys.shape[2]
+
+        if self.attn_backend == "sdpa":
+            context_vec = self._sdpa(queries, keys, values, num_tokens, num_keys, attn_mask)
+        else:
+            context_vec = self._eager(queries, keys, values, num_tokens, num_keys, attn_mask)
 
-        keys = keys.view(b, num_tokens, self.num_heads, self.head_dim).transpose(1, 2)
-        queries = queries.view(b, num_tokens, self.num_heads, self.head_dim).transpose(1, 2)
-        values = values.view(b, num_tokens, self.num_heads, self.head_dim).transpose(1, 2)
+        context_vec = context_vec.transpose(1, 2).contiguous().view(b, num_tokens, self.d_out)
+        context_vec = self.out_proj(context_vec)
+        return context_vec
 
+    def _sdpa(self, queries, keys, values, num_tokens, num_keys, attn_mask):
+        dropout_p = self.dropout.p if self.training else 0.0
+        if attn_mask is None and num_tokens == num_keys:
+            return F.scaled_dot_product_attention(queries, keys, values, dropout_p=dropout_p, is_causal=True)
+        if attn_mask is None and num_tokens == 1:
+            # A single new token may attend to every cached position
+            return F.scaled_dot_product_attention(queries, keys, values, dropout_p=dropout_p)
+
+        # SDPA's bool mask marks positions that *may* be attended
+        allowed = ~self._causal_mask(num_tokens, num_keys)
+        if attn_mask is not None:
+            allowed = allowed & attn_mask[:, None, None, :]
+        return F.scaled_dot_product_attention(queries, keys, values, attn_mask=allowed, dropout_p=dropout_p)
+
+    def _eager(self, queries, keys, values, num_tokens, num_keys, attn_mask):
         attn_scores = queries @ keys.transpose(2, 3)
-        mask_bool = self.mask.bool()[:num_tokens, :num_tokens]
+        mask_bool = self._causal_mask(num_tokens, num_keys)
+        if attn_mask is not None:
+            # attn_mask: (b, num_keys), True = valid key (False = padding)
+            mask_bool = mask_bool | ~attn_mask[:, None, None, :]
         attn_scores.masked_fill_(mask_bool, -torch.inf)
 
         attn_weights = torch.softmax(attn_scores / keys.shape[-1]**0.5, dim=-1)
         attn_weights = self.dropout(attn_weights)
-
-        context_vec = (attn_weights @ values).transpose(1, 2).contiguous().view(b, num_tokens, self.d_out)
-        context_vec = self.out_proj(context_vec)
-        return context_vec
+        return attn_weights @ values
 
 
 class LayerNorm(nn.Module):
@@ -87,14 +156,15 @@ class TransformerBlock(nn.Module):
             context_length=cfg["context_length"],
             num_heads=cfg["n_heads"],
             dropout=cfg["drop_rate"],
-            qkv_bias=cfg["qkv_bias"])
+            qkv_bias=cfg["qkv_bias"],
+            attn_backend=cfg.get("attn_backend", "sdpa"))
         self.ff = FeedForward(cfg)
         self.norm1 = LayerNorm(cfg["emb_dim"])
         self.norm2 = LayerNorm(cfg["emb_dim"])
         self.drop_shortcut = nn.Dropout(cfg["drop_rate"])
 
-    def forward(self, x):
-        x = x + self.drop_shortcut(self.att(self.norm1(x)))
+    def forward(self, x, kv_cache=None, layer_idx=0, attn_mask=None):
+        x = x + self.drop_shortcut(self.att(self.norm1(x), kv_cache=kv_cache, layer_idx=layer_idx, attn_mask=attn_mask))
         x = x + self.drop_shortcut(self.ff(self.norm2(x)))
         return x
 
@@ -111,13 +181,20 @@ class GPTModel(nn.Module):
         self.final_norm = LayerNorm(cfg["emb_dim"])
         self.out_head = nn.Linear(cfg["emb_dim"], cfg["vocab_size"], bias=False)
 
-    def forward(self, in_idx):
+    def forward(self, in_idx, kv_cache=None, pos_ids=None, attn_mask=None):
         batch_size, seq_len = in_idx.shape
         tok_embeds = self.tok_emb(in_idx)
-        pos_embeds = self.pos_emb(torch.arange(seq_len, device=in_idx.device))
+        if pos_ids is None:
+            start_pos = kv_cache.seq_len if kv_cache is not None else 0
+            pos_ids = torch.arange(start_pos, start_pos + seq_len, device=in_idx.device)
+        pos_embeds = self.pos_emb(pos_ids)
         x = tok_embeds + pos_embeds
         x = self.drop_emb(x)
-        x = self.trf_blocks(x)
+        if kv_cache is None and attn_mask is None:
+            x = self.trf_blocks(x)
+        else:
+            for layer_idx, block in enumerate(self.trf_blocks):
+                x = block(x, kv_cache=kv_cache, layer_idx=layer_idx, attn_mask=attn_mask)
         x = self.final_norm(x)
         logits = self.out_head(x)
         return logits
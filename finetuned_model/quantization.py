@@ -0,0 +1,83 @@
+import copy
+import torch
+import torch.nn as nn
+
+
+def quantize_dynamic_int8(model):
+    # Replace every nn.Linear (attention projections, feed-forward and out_head) with a
+    # dynamically quantized int8 version; embeddings and LayerNorm stay fp32. CPU only.
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+
+# ========== Accuracy check: int8 vs fp32 ==========
+
+SAMPLE_TEXTS = [
+    "You are a winner you have been specially selected to receive $1000 cash or a $2000 award.",
+    "URGENT! Your mobile number has won a free trip. Call 09061701461 now to claim.",
+    "Hey, just wanted to check if you're still coming to dinner tonight?",
+    "Sorry I'll be late, the train is delayed. See you at the office.",
+    "Congratulations! You've been chosen for a free iPhone. Click the link to claim your prize.",
+    "Can you send me the slides from today's meeting when you get a chance?",
+]
+
+SAMPLE_PROMPTS = [
+    "Below is an instruction that describes a task. Write a response that appropriately completes the request."
+    "\n\n### Instruction:\nRewrite the sentence using a simile.\n\n### Input:\nThe car is very fast.",
+    "Below is an instruction that describes a task. Write a response that appropriately completes the request."
+    "\n\n### Instruction:\nWhat type of cloud is typically associated with thunderstorms?",
+    "Below is an instruction that describes a task. Write a response that appropriately completes the request."
+    "\n\n### Instruction:\nRewrite the following sentence using passive voice.\n\n### Input:\nThe team achieved great results.",
+]
+
+
+def compare_classifier(fp32_model, int8_model, tokenizer, texts=SAMPLE_TEXTS):
+    from load_classifier import classify_batch
+
+    cpu = torch.device("cpu")
+    fp32_results = classify_batch(texts, fp32_model, tokenizer, cpu, pad_to_longest=False)
+    int8_results = classify_batch(texts, int8_model, tokenizer, cpu, pad_to_longest=False)
+
+    rows = []
+    for text, (fp32_label, fp32_conf), (int8_label, int8_conf) in zip(texts, fp32_results, int8_results):
+        rows.append({
+            "text": text,
+            "fp32": (fp32_label, fp32_conf),
+            "int8": (int8_label, int8_conf),
+            "label_match": fp32_label == int8_label,
+            "confidence_diff": abs(float(fp32_conf) - float(int8_conf)),
+        })
+    return rows
+
+
+def compare_generator(fp32_model, int8_model, tokenizer, prompts=SAMPLE_PROMPTS):
+    from load_generator import generate_text
+
+    rows = []
+    for prompt in prompts:
+        fp32_text = generate_text(prompt, fp32_model, tokenizer)
+        int8_text = generate_text(prompt, int8_model, tokenizer)
+        rows.append({"prompt": prompt, "fp32": fp32_text, "int8": int8_text, "exact_match": fp32_text == int8_text})
+    return rows
+
+
+if __name__ == "__main__":
+    # Run from the repository root: PYTHONPATH=.:finetuned_model python finetuned_model/quantization.py
+    from load_classifier import load_model_and_tokenizer
+    from load_generator import load_generation_model
+
+    model, tokenizer, _ = load_model_and_tokenizer()
+    model.to("cpu")
+    cls_rows = compare_classifier(model, quantize_dynamic_int8(copy.deepcopy(model)), tokenizer)
+    print("=== Classifier (fp32 vs int8) ===")
+    for row in cls_rows:
+        print(f"{row['fp32']} -> {row['int8']}  diff={row['confidence_diff']:.2f}  {row['text'][:60]}")
+    agreement = sum(row["label_match"] for row in cls_rows) / len(cls_rows)
+    print(f"label agreement: {agreement:.0%}, max confidence diff: {max(r['confidence_diff'] for r in cls_rows):.2f}")
+
+    gen_model, gen_tokenizer = load_generation_model()
+    gen_rows = compare_generator(gen_model, quantize_dynamic_int8(copy.deepcopy(gen_model)), gen_tokenizer)
+    print("=== Generator (fp32 vs int8) ===")
+    for row in gen_rows:
+        print(f"fp32: {row['fp32']!r}\nint8: {row['int8']!r}\nexact match: {row['exact_match']}\n")
+    exact = sum(row["exact_match"] for row in gen_rows) / len(gen_rows)
+    print(f"exact-match rate: {exact:.0%}")
@@ -0,0 +1,35 @@
+from typing import List
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+# ローカル開発・テスト用の代替品（Bedrock / Knowledge Base に接続しない）
+SAMPLE_DOCUMENTS = [
+    Document(page_content="Hondaでプロジェクトリーダーとして、需給計画システムのソリューション選定を担当。"),
+    Document(page_content="PythonとAWS（Bedrock, Lambda）を用いた生成AIアプリケーションの開発経験あり。"),
+    Document(page_content="日本語・中国語・英語でのコミュニケーションが可能。"),
+]
+
+
+class FakeRetriever(BaseRetriever):
+    """質問と共通する文字が多い順に k 件返すだけの検索器"""
+
+    documents: List[Document] = SAMPLE_DOCUMENTS
+    k: int = 2
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        chars = set(query)
+        ranked = sorted(self.documents, key=lambda d: -len(chars & set(d.page_content)))
+        return ranked[:self.k]
+
+
+def fake_chat_model(responses=None, sleep=None) -> FakeListChatModel:
+    """
+    決まった回答を順番に返すチャットモデル（stream 時は1文字ずつ返す）。
+    sleep を指定すると1文字ごとに待つので、ストリーミング表示の確認に使える。
+    """
+    return FakeListChatModel(
+        responses=responses or ["（テスト用の回答）contextに基づく回答はここに表示されます。"],
+        sleep=sleep,
+    )
@@ -1,3 +1,5 @@
+import os
+import asyncio
 from langchain_aws import ChatBedrock
 from langchain_aws.retrievers import AmazonKnowledgeBasesRetriever
 from langchain_core.output_parsers import StrOutputParser
@@ -5,34 +7,49 @@ from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import RunnablePassthrough
 import boto3
 
-session = boto3.Session()
-kb_client = session.client("bedrock-runtime", region_name="us-east-1")
-
-# 初期化はグローバルに一度だけ行う（FastAPIの起動時）
-retriever = AmazonKnowledgeBasesRetriever(
-    knowledge_base_id="PFGPGVDWRJ",
-    retrieval_config={"vectorSearchConfiguration": {"numberOfResults": 10}},
-    region_name="us-east-1"  # 显式指定区域
-)
+USE_FAKE_RAG = False        # True: Bedrock / Knowledge Base に接続せず rag/fakes.py の代替品を使う（ローカル確認・テスト用）
+DEFAULT_EXECUTOR_WORKERS = min(32, (os.cpu_count() or 1) + 4)  # asyncio 既定スレッドプールのスレッド数（Python 3.8+ の既定値と同じ式）
+RAG_MAX_CONCURRENCY = max(1, min(4, DEFAULT_EXECUTOR_WORKERS // 2))  # 同時に実行する RAG チェーンの上限（既定スレッドプールの半分まで）
+RAG_QUEUE_TIMEOUT = 30      # 上限に達しているとき空きを待つ最大秒数
 
 prompt = ChatPromptTemplate.from_template(
     "以下のcontextに基づいて、できるだけ丁寧に日本語で回答してください。\n\nContext:\n{context}\n\n質問:\n{question}"
 )
 
 
-model = ChatBedrock(
-    client=kb_client,
-    model_id="anthropic.claude-3-sonnet-20240229-v1:0",
-    model_kwargs={"max_tokens": 1000},
-)
+def build_rag_chain(retriever, model):
+    """検索器とチャットモデルからチェーンを構成する（テストでは代替品を渡す）"""
+    return (
+            {"context": retriever, "question": RunnablePassthrough()}
+            | prompt
+            | model
+            | StrOutputParser()
+    )
+
+
+# 初期化はグローバルに一度だけ行う（FastAPIの起動時）
+if USE_FAKE_RAG:
+    from rag.fakes import FakeRetriever, fake_chat_model
+    retriever = FakeRetriever()
+    model = fake_chat_model(sleep=0.02)
+else:
+    session = boto3.Session()
+    kb_client = session.client("bedrock-runtime", region_name="us-east-1")
+
+    retriever = AmazonKnowledgeBasesRetriever(
+        knowledge_base_id="PFGPGVDWRJ",
+        retrieval_config={"vectorSearchConfiguration": {"numberOfResults": 10}},
+        region_name="us-east-1"  # 显式指定区域
+    )
+
+    model = ChatBedrock(
+        client=kb_client,
+        model_id="anthropic.claude-3-sonnet-20240229-v1:0",
+        model_kwargs={"max_tokens": 1000},
+    )
 
 # チェーンを構成
-rag_chain = (
-        {"context": retriever, "question": RunnablePassthrough()}
-        | prompt
-        | model
-        | StrOutputParser()
-)
+rag_chain = build_rag_chain(retriever, model)
 
 # FastAPIから呼び出せる関数
 def real_rag_answer(question: str) -> str:
@@ -40,3 +57,66 @@ def real_rag_answer(question: str) -> str:
         return rag_chain.invoke(question)
     except Exception as e:
         return f"エラーが発生しました: {str(e)}"
+
+
+RAG_BUSY_MESSAGE = "ただいま混み合っています。しばらくしてから再度お試しください。"
+
+
+class RagBusyError(Exception):
+    pass
+
+
+class RagService:
+    """
+    rag_chain の非同期版（ainvoke / astream）。
+    ChatBedrock と AmazonKnowledgeBasesRetriever には非同期実装がなく、LangChain が同期版を
+    asyncio 既定のスレッドプール（run_in_executor）で実行するため、チェーン 1 本がほぼ 1 スレッドを占有する。
+    このプールは asyncio.to_thread を使う他の処理と共用なので、同時に走るチェーンは max_concurrency 本までに制限し、
+    超えた分は queue_timeout 秒まで空きを待つ。
+    """
+
+    def __init__(self, chain, max_concurrency=RAG_MAX_CONCURRENCY, queue_timeout=RAG_QUEUE_TIMEOUT):
+        self.chain = chain
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self._slots = asyncio.Semaphore(max_concurrency)
+
+    async def _acquire(self):
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise RagBusyError()
+
+    async def stream(self, question: str):
+        """
+        回答の断片が届くたびに yield ("chunk"|"error", 値)。
+        （agent.agent_chatter.stream_bedrock_agent と同じ形式）
+        """
+        try:
+            await self._acquire()
+        except RagBusyError:
+            yield "error", RAG_BUSY_MESSAGE
+            return
+        try:
+            async for chunk in self.chain.astream(question):
+                if chunk:
+                    yield "chunk", chunk
+        except Exception as e:
+            yield "error", f"エラーが発生しました: {str(e)}"
+        finally:
+            self._slots.release()
+
+    async def answer(self, question: str) -> str:
+        try:
+            await self._acquire()
+        except RagBusyError:
+            return RAG_BUSY_MESSAGE
+        try:
+            return await self.chain.ainvoke(question)
+        except Exception as e:
+            return f"エラーが発生しました: {str(e)}"
+        finally:
+            self._slots.release()
+
+
+rag_service = RagService(rag_chain)
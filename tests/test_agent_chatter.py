@@ -0,0 +1,63 @@
+import time
+import asyncio
+
+import agent.agent_chatter as agent_chatter
+from agent.agent_chatter import run_bedrock_agent, run_bedrock_agent_async, stream_bedrock_agent
+from agent.fakes import FakeAgentClient
+
+
+def collect(prompt, client):
+    async def run():
+        return [event async for event in stream_bedrock_agent(prompt, agent_client=client)]
+    return asyncio.run(run())
+
+
+def test_stream_reassembles_split_multibyte_chunks():
+    # 每 4 字节切一次，日文字符会跨 chunk
+    client = FakeAgentClient(answer="東京の天気は晴れです。", category="c", chunk_size=4)
+    events = collect("天気", client)
+    assert "".join(value for kind, value in events if kind == "chunk") == "東京の天気は晴れです。"
+    assert events[-1] == ("category", "c")
+    assert client.calls[0]["inputText"] == "天気"
+
+
+def test_sync_and_async_results_match():
+    client = FakeAgentClient(answer="最新情報です。", category="a")
+    expected = {"text": "最新情報です。", "category": "a"}
+    assert run_bedrock_agent("x", agent_client=client) == expected
+    assert asyncio.run(run_bedrock_agent_async("x", agent_client=client)) == expected
+
+
+def test_concurrent_streams_are_bounded(monkeypatch):
+    monkeypatch.setattr(agent_chatter, "AGENT_QUEUE_TIMEOUT", 0.05)
+
+    async def run():
+        monkeypatch.setattr(agent_chatter, "_stream_slots", asyncio.Semaphore(1))
+        slow = FakeAgentClient(answer="abcdef", chunk_size=1, delay=0.05)
+        first = stream_bedrock_agent("1", agent_client=slow)
+        assert await first.__anext__() == ("chunk", "a")
+        # 第 1 个调用占着名额时，第 2 个等待超时后返回 busy
+        second = [event async for event in stream_bedrock_agent("2", agent_client=FakeAgentClient())]
+        assert second == [("error", agent_chatter.AGENT_BUSY_MESSAGE)]
+        rest = [event async for event in first]
+        assert rest[-1] == ("category", "b")
+        # 第 1 个调用的线程结束后名额归还
+        third = [event async for event in stream_bedrock_agent("3", agent_client=FakeAgentClient())]
+        assert third[-1] == ("category", "b")
+
+    asyncio.run(run())
+
+
+def test_abandoned_stream_stops_worker(monkeypatch):
+    async def run():
+        monkeypatch.setattr(agent_chatter, "_stream_slots", asyncio.Semaphore(1))
+        client = FakeAgentClient(answer="x" * 100, chunk_size=1, delay=0.01)
+        stream = stream_bedrock_agent("1", agent_client=client)
+        await stream.__anext__()
+        await stream.aclose()
+        # 后台线程在下一个事件处停止并归还名额
+        await asyncio.wait_for(agent_chatter._stream_slots.acquire(), 1)
+
+    start = time.perf_counter()
+    asyncio.run(run())
+    assert time.perf_counter() - start < 0.5
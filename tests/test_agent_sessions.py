@@ -0,0 +1,40 @@
+import asyncio
+
+import pytest
+
+from agent.agent_sessions import AgentSessionPool, SessionBusyError
+
+
+def test_inflight_session_survives_lru_eviction():
+    pool = AgentSessionPool(maxsize=1, max_inflight=1)
+
+    async def run():
+        async with pool.turn("a") as agent_session_a:
+            # 会话 a 进行中时其它会话挤满 LRU，a 也不会被淘汰
+            async with pool.turn("b"):
+                pass
+            async with pool.turn("c"):
+                pass
+            with pytest.raises(SessionBusyError):
+                async with pool.turn("a"):
+                    pass
+        async with pool.turn("a") as again:
+            assert again == agent_session_a
+
+    asyncio.run(run())
+    assert pool.stats()["active"] == 0
+
+
+def test_idle_session_is_reused_and_expires():
+    pool = AgentSessionPool(maxsize=10, idle_ttl=0.05)
+
+    async def run():
+        async with pool.turn("a") as first:
+            pass
+        async with pool.turn("a") as second:
+            assert second == first
+        await asyncio.sleep(0.1)
+        async with pool.turn("a") as third:
+            assert third != first
+
+    asyncio.run(run())
@@ -0,0 +1,39 @@
+import io
+import asyncio
+import zipfile
+
+from create_order.bulk_pdf import render_in_order, stream_zip
+from create_order.pdf_renderer import PdfRenderTimeout
+
+
+class FakePool:
+    """HTML 原样当作 PDF 字节返回；"timeout" / "broken" 模拟渲染失败"""
+
+    async def render(self, html_str, base_url, template_id):
+        await asyncio.sleep(0)
+        if html_str == "timeout":
+            raise PdfRenderTimeout()
+        if html_str == "broken":
+            raise RuntimeError("template error")
+        return html_str.encode()
+
+
+def build_zip(htmls):
+    jobs = ((f"order_{i + 1:05d}.pdf", lambda html=html: html, "t") for i, html in enumerate(htmls))
+
+    async def run():
+        named_pdfs = render_in_order(jobs, FakePool(), "/static", window=2)
+        return b"".join([chunk async for chunk in stream_zip(named_pdfs)])
+
+    return zipfile.ZipFile(io.BytesIO(asyncio.run(run())))
+
+
+def test_failed_job_becomes_error_entry():
+    zf = build_zip(["a", "timeout", "c", "broken", "e"])
+    # 失败的注文换成说明文件，后面的注文照常输出，顺序不变
+    assert zf.namelist() == [
+        "order_00001.pdf", "order_00002.ERROR.txt", "order_00003.pdf", "order_00004.ERROR.txt", "order_00005.pdf",
+    ]
+    assert zf.read("order_00003.pdf") == b"c"
+    assert "タイムアウト" in zf.read("order_00002.ERROR.txt").decode()
+    assert "template error" in zf.read("order_00004.ERROR.txt").decode()
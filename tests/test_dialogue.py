@@ -0,0 +1,52 @@
+import threading
+from decimal import Decimal
+
+import pytest
+
+from create_order.schemas import OrderDraft
+from create_order.dialogue import add_item, apply_answers, calc_missing, to_order_if_complete
+from create_order.dialogue_store import DialogueState, MemoryDialogueStore, SQLiteDialogueStore
+
+
+def test_out_of_constraint_answer_is_rejected():
+    d = OrderDraft(buyer={"name": "山田"}, items=[{"sku": "AB-1", "name": "ペン", "qty": 2}])
+
+    # 超过 decimal_places=2 的单价不接受，同一字段重新提问
+    assert apply_answers(d, ["items[0].unit_price"], "100.555円") == []
+    assert d.items[0].unit_price is None
+    assert calc_missing(d) == ["items[0].unit_price"]
+
+    assert apply_answers(d, ["items[0].unit_price"], "100.55円") == ["items[0].unit_price"]
+    assert d.items[0].unit_price == Decimal("100.55")
+    done, order = to_order_if_complete(d)
+    assert done and order.items[0].unit_price == Decimal("100.55")
+
+
+def test_multi_field_answer_keeps_valid_parts():
+    d = OrderDraft(buyer={"name": "山田"})
+    fields = ["items[0].sku", "items[0].name", "items[0].qty", "items[0].unit_price"]
+
+    filled = apply_answers(d, fields, "SKU AB-1、ボールペン、3個、単価1234567890123円")
+    assert sorted(filled) == ["items[0].name", "items[0].qty", "items[0].sku"]
+    assert calc_missing(d) == ["items[0].unit_price"]
+
+
+@pytest.mark.parametrize("kind", ["memory", "sqlite"])
+def test_concurrent_updates_under_session_lock(kind, tmp_path):
+    store = MemoryDialogueStore() if kind == "memory" else SQLiteDialogueStore(str(tmp_path / "d.sqlite3"))
+    session_id = store.create(DialogueState(draft=OrderDraft(items=[]), fields=[]))
+
+    def add():
+        # 与 api_server 的 handler 相同：读取 → 修改 → 保存 都在会话锁内
+        with store.session_lock(session_id):
+            state = store.get(session_id)
+            add_item(state.draft)
+            store.save(session_id, state)
+
+    threads = [threading.Thread(target=add) for _ in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    # 没有丢失的更新
+    assert len(store.get(session_id).draft.items) == 20
@@ -0,0 +1,37 @@
+import asyncio
+
+from rag.fakes import FakeRetriever, fake_chat_model
+from rag.rag_retriever import RAG_BUSY_MESSAGE, RagService, build_rag_chain
+
+
+def make_service(answer="Pythonの経験があります。", sleep=None, **kwargs):
+    chain = build_rag_chain(FakeRetriever(), fake_chat_model([answer], sleep=sleep))
+    return RagService(chain, **kwargs)
+
+
+def test_answer_and_stream():
+    service = make_service()
+    assert asyncio.run(service.answer("Python")) == "Pythonの経験があります。"
+
+    async def collect():
+        return [event async for event in service.stream("Python")]
+
+    events = asyncio.run(collect())
+    assert all(kind == "chunk" for kind, _ in events)
+    assert "".join(value for _, value in events) == "Pythonの経験があります。"
+
+
+def test_busy_when_slots_are_taken():
+    async def run():
+        service = make_service(answer="abcdef", sleep=0.05, max_concurrency=1, queue_timeout=0.05)
+        first = service.stream("1")
+        assert await first.__anext__() == ("chunk", "a")
+        # 第 1 条链占着名额时，后来的请求等待超时后返回 busy
+        assert await service.answer("2") == RAG_BUSY_MESSAGE
+        assert [event async for event in service.stream("3")] == [("error", RAG_BUSY_MESSAGE)]
+        rest = [value async for _, value in first]
+        assert "".join(rest) == "bcdef"
+        # 名额归还后可以再次执行
+        assert await service.answer("4") == "abcdef"
+
+    asyncio.run(run())
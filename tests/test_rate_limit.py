@@ -0,0 +1,20 @@
+from commons.rate_limit import RateLimiter
+
+
+def test_route_limits_share_global_budget():
+    limiter = RateLimiter(default_limit=5, route_limits={"/api/a": 3, "/api/b": 3})
+    # 各路由组单独都没用完，但合计达到 default_limit 后一律拒绝
+    results = [limiter.allow("1.2.3.4", path) for path in ["/api/a"] * 3 + ["/api/b"] * 3]
+    assert results == [True, True, True, True, True, False]
+    assert not limiter.allow("1.2.3.4", "/other")
+    # 其他客户端不受影响
+    assert limiter.allow("5.6.7.8", "/api/a")
+
+
+def test_route_limit_rejection_keeps_global_budget():
+    limiter = RateLimiter(default_limit=5, route_limits={"/api/a": 1})
+    assert limiter.allow("1.2.3.4", "/api/a")
+    assert not limiter.allow("1.2.3.4", "/api/a")
+    assert not limiter.allow("1.2.3.4", "/api/a")
+    # 被路由组拒绝的请求不消耗全体额度：剩余 4 次
+    assert [limiter.allow("1.2.3.4", "/x") for _ in range(5)] == [True, True, True, True, False]
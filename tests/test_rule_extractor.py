@@ -0,0 +1,26 @@
+import pytest
+
+from create_order.llm_parser import RULE_CONFIDENCE_THRESHOLD
+from create_order.rule_extractor import extract_order_rules
+
+BASE = "ABC-123のボールペンを5個、単価120円で山田さんへ"
+
+
+def test_simple_request_is_served_by_rules():
+    draft, confidence = extract_order_rules(BASE)
+    assert confidence >= RULE_CONFIDENCE_THRESHOLD
+    assert draft.items[0].sku == "ABC-123" and draft.items[0].qty == 5
+
+
+@pytest.mark.parametrize("extra", [
+    "。3/15までに",
+    "。１２／２４着でお願いします",  # 全角字符经 NFKC 规范化后同样识别
+    "。15日までにお願いします",
+    "。至急",
+    "。急ぎでお願いします",
+    "。明日お届け希望",
+])
+def test_dates_and_urgency_fall_through_to_llm(extra):
+    # 含有规则抽取处理不了的期日・加急指示时交给 LLM
+    _, confidence = extract_order_rules(BASE + extra)
+    assert confidence < RULE_CONFIDENCE_THRESHOLD
@@ -0,0 +1,64 @@
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from pydantic import ValidationError
+
+from create_order.schemas import Order, OrderDraft, Currency
+from create_order.validation import construct_draft, construct_order, sign_order, verify_order
+
+
+def order_json():
+    order = Order(
+        issue_date=date(2025, 1, 31),
+        seller={"name": "default seller name"},
+        buyer={"name": "株式会社テスト"},
+        items=[{"sku": "ABC-001", "name": "ボールペン", "qty": 2, "unit_price": "120.50"}],
+    )
+    return order.model_dump(mode="json")
+
+
+def test_construct_order_takes_fast_path():
+    data = order_json()
+    # qty=0 通不过校验；能构造出来说明走的是跳过校验的快速路径
+    data["items"][0]["qty"] = 0
+    with pytest.raises(ValidationError):
+        Order(**data)
+
+    order = construct_order(data)
+    assert order.items[0].qty == 0
+    assert order.issue_date == date(2025, 1, 31)
+    assert order.items[0].unit_price == Decimal("120.50")
+    assert order.currency is Currency.JPY
+
+
+def test_construct_order_matches_validation():
+    data = order_json()
+    assert construct_order(data).model_dump(mode="json") == Order(**data).model_dump(mode="json")
+
+
+def test_construct_draft_takes_fast_path():
+    data = OrderDraft(items=[{"sku": "ABC-001", "qty": 1}]).model_dump(mode="json", exclude_none=True)
+    data["items"][0]["qty"] = 0
+    with pytest.raises(ValidationError):
+        OrderDraft(**data)
+
+    draft = construct_draft(data)
+    assert draft.items[0].qty == 0
+    assert draft.items[0].sku == "ABC-001"
+
+
+def test_unexpected_keys_fall_back_to_validation():
+    data = order_json()
+    data["発行日"] = data.pop("issue_date")  # 别名键不是可信数据的形状，退回正常校验
+    order = construct_order(data)
+    assert order.issue_date == date(2025, 1, 31)
+
+
+def test_order_token_roundtrip():
+    data = order_json()
+    token = sign_order(data)
+    assert verify_order(data, token)
+    data["items"][0]["qty"] = 3
+    assert not verify_order(data, token)
+    assert not verify_order(data, None)